@@ -0,0 +1,73 @@
+from functools import partial
+
+from jax import random
+
+from cr.sparse import pursuit
+import cr.sparse.data as crdata
+import cr.sparse.dict as crdict
+
+from cr.sparse.pursuit import cosamp
+from cr.sparse.pursuit import sp
+from cr.sparse.pursuit import htp
+
+
+# Hard Thresholding Pursuit
+htp_solve_jit = partial(htp.matrix_solve_jit, normalized=False)
+htp_precomputed_jit = partial(htp.precomputed_solve_jit, normalized=False)
+htp_multi = partial(htp.matrix_solve_multi, normalized=False)
+
+K = 16
+M = 256
+N = 4096
+S = 32
+
+key = random.PRNGKey(8)
+keys = random.split(key, 3)
+Phi = crdict.gaussian_mtx(keys[0], M, N)
+x, omega = crdata.sparse_normal_representations(keys[1], N, K, 1)
+y = Phi @ x
+X, omegas = crdata.sparse_normal_representations(keys[2], N, K, S)
+Y = Phi @ X
+# Gram matrix shared by the precomputed solves
+pre = pursuit.precompute(Phi)
+
+
+def wrap_solve(solver, *args):
+    solution = solver(*args, K)
+    solution.x_I.block_until_ready()
+    solution.I.block_until_ready()
+    solution.r_norm_sqr.block_until_ready()
+    return solution
+
+# A single solve correlates with Phi directly and never forms the N x N Gram matrix
+
+def time_cosamp():
+    wrap_solve(cosamp.matrix_solve_jit, Phi, y)
+
+def time_sp():
+    wrap_solve(sp.matrix_solve_jit, Phi, y)
+
+def time_htp():
+    wrap_solve(htp_solve_jit, Phi, y)
+
+# The Gram matrix is computed once and reused across solves
+
+def time_cosamp_precomputed():
+    wrap_solve(cosamp.precomputed_solve_jit, pre, y)
+
+def time_sp_precomputed():
+    wrap_solve(sp.precomputed_solve_jit, pre, y)
+
+def time_htp_precomputed():
+    wrap_solve(htp_precomputed_jit, pre, y)
+
+# S signals share one Gram matrix
+
+def time_cosamp_multi():
+    wrap_solve(cosamp.matrix_solve_multi, Phi, Y)
+
+def time_sp_multi():
+    wrap_solve(sp.matrix_solve_multi, Phi, Y)
+
+def time_htp_multi():
+    wrap_solve(htp_multi, Phi, Y)
@@ -199,7 +199,8 @@ def compute_B_B_inv(B0):
     b = B0.shape[0]
     c = r ** jnp.arange(b)
     B = crn.toeplitz_mat(c, c)
-    B_inv = jnp.linalg.inv(B)
+    # B is an AR-1 correlation matrix, hence SPD: invert via Cholesky
+    B_inv = jax.scipy.linalg.cho_solve(jax.scipy.linalg.cho_factor(B), jnp.eye(b))
     return B, B_inv
 
 # This rule doesn't seem to work in noiseless case
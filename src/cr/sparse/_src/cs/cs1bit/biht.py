@@ -19,8 +19,9 @@ import jax.numpy as jnp
 from jax import vmap, jit, lax
 from jax.numpy.linalg import norm
 
-from cr.nimble.dsp import (hard_threshold,
-    build_signal_from_indices_and_values)
+from cr.nimble.dsp import build_signal_from_indices_and_values
+
+from cr.sparse._src.pursuit.util import hard_threshold
 
 
 class BIHTState(NamedTuple):
@@ -99,7 +100,7 @@ def biht(Phi, y, K, tau, max_iters=1000):
 
     def init():
         # Data for the initial approximation [r = y, x = 0]
-        I = jnp.arange(0, K)
+        I = jnp.arange(0, K, dtype=jnp.int32)
         x_I = jnp.zeros(K)
         # Assume initial estimate to be zero and compute residual
         # compute the 1 bit output based on current x estimate
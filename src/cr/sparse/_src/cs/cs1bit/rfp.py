@@ -80,7 +80,6 @@ def rfp(Phi, y, x0, lambda_=1., delta=0.1, inner_iters=200, outer_iters=20):
     algorithm     
     """
     tau = delta / lambda_
-    print(f'shrinkage threshold: {tau}')
 
     def rfpi_inner(x0, lambda_):
         def init_fun():
@@ -94,16 +93,13 @@ def rfp(Phi, y, x0, lambda_=1., delta=0.1, inner_iters=200, outer_iters=20):
             correlation = y * measurement
             # Only the bits which are wrong are important for further consideration
             problems = jnp.where(correlation <= 0, -correlation, 0)
-            print(f'number of wrong signs: {jnp.sum(correlation < 0)}, {jnp.sum(problems)}')
             # multiply with the bit vector Y^T (f'(term))
             problems = y * problems
             # correlate with columns of Phi
             f_bar = Phi.T @ problems
-            print(f'f_bar: {norm(f_bar)}')
             # STEP-4
             # Gradient Projection on Sphere Surface
             f_tilde = f_bar - jnp.vdot(f_bar,  state.x) *  state.x 
-            print(f'f_tilde: {norm(f_tilde)}, {jnp.max(jnp.abs(f_tilde))}')
             # One-sided quadratic gradient descent
             h = state.x - delta * f_tilde
             #print(jnp.sum(jnp.abs(h)>0.1))
@@ -115,18 +111,9 @@ def rfp(Phi, y, x0, lambda_=1., delta=0.1, inner_iters=200, outer_iters=20):
 
         def cond_fun(state):
             # limit on number of iterations
-            a = state.iterations < inner_iters
-            diff = state.x - state.x_prev
-            d_norm = norm(diff)
-            #print(f'd_norm={d_norm}')
-            b = d_norm > 1e-4
-            return a
-            return jnp.logical_and(a, b)
-
-        state = init_fun()
-        while cond_fun(state):
-            state = body_fun(state)
-        # state = lax.while_loop(cond, body, init())
+            return state.iterations < inner_iters
+
+        state = lax.while_loop(cond_fun, body_fun, init_fun())
         return state
     
     for i in range(outer_iters):
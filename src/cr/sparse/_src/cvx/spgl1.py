@@ -28,12 +28,14 @@ import math
 
 from typing import NamedTuple, Callable
 
+import numpy as np
 from numpy import array_str
 import jax
 from jax import lax, jit, device_get
 import jax.numpy as jnp
 
 import cr.sparse as crs
+import cr.sparse.lop as lop
 import cr.nimble as crn
 norm = crn.arr_l2norm
 
@@ -41,7 +43,8 @@ norm = crn.arr_l2norm
 #  Constants
 ############################################################################
 
-EPS = jnp.finfo(jnp.float32).eps
+HOST_MAX_N = 2048
+"Largest number of columns of a NumPy matrix for which the host solver is used"
 
 
 ############################################################################
@@ -78,26 +81,67 @@ class SPGL1Options(NamedTuple):
 #  L1-Ball Projections
 ############################################################################
 
+def _l1_ball_threshold(u, q):
+    """Computes the shrinkage threshold for projecting onto an l1 norm ball
+
+    The threshold is found by the pivot-partition scheme of
+    Michelot/Condat. The pivot set starts with all the entries of ``u``.
+    In each step, the entries at or below the current pivot are dropped
+    and the pivot is recomputed from the remaining ones. The pivot
+    increases monotonically and the set stops changing after a few
+    passes. Each pass is a masked O(n) reduction. No sorting is needed.
+
+    Args:
+        u (jax.numpy.ndarray): Absolute values of the vector to be projected
+        q (float): Radius of the l1 norm ball
+
+    Returns:
+        (float): The shrinkage threshold kappa
+    """
+    n = u.size
+
+    def init():
+        # all entries are in the pivot set initially
+        kappa = (jnp.sum(u) - q) / n
+        return kappa, n, n + 1
+
+    def body_func(state):
+        kappa, card, _ = state
+        # partition the entries around the current pivot
+        mask = u > kappa
+        card_new = jnp.sum(mask)
+        sum_new = jnp.sum(jnp.where(mask, u, 0))
+        # an empty set is only possible for q = 0. keep the last pivot
+        empty = card_new == 0
+        kappa_new = (sum_new - q) / jnp.maximum(card_new, 1)
+        kappa = jnp.where(empty, kappa, kappa_new)
+        card_new = jnp.where(empty, card, card_new)
+        return kappa, card_new, card
+
+    def cond_func(state):
+        _, card, card_prev = state
+        # continue as long as the pivot set keeps shrinking
+        return card < card_prev
+
+    kappa, _, _ = lax.while_loop(cond_func, body_func, init())
+    return kappa
+
+
 def _project_to_l1_ball(x, q):
-    """Projects a vector inside an l1 norm ball
+    """Projects a vector inside an l1 norm ball without any branching
+
+    The threshold is clamped at zero so that a vector already inside
+    the ball is returned unchanged. The SPGL1 solvers call this directly
+    as their iterates are nearly always outside or on the boundary.
     """
-    # sort the absolute values in descending order
-    u = jnp.sort(jnp.abs(x))[::-1]
-    # compute the cumulative sums
-    cu = jnp.cumsum(u)
-    # find the index where the cumulative sum is below the threshold
-    cu_diff = cu - q
-    u_scaled = u*jnp.arange(1, 1+len(u))
-    flags = cu_diff > u_scaled
-    K = jnp.argmax(flags)
-    K = jnp.where(K == 0, len(flags), K)
+    u = jnp.abs(x)
     # compute the shrinkage threshold
-    kappa = (cu[K-1] - q)/K
+    kappa = jnp.maximum(_l1_ball_threshold(u, q), 0.)
     # perform shrinkage
     if jnp.iscomplexobj(x):
-        return jnp.maximum(jnp.abs(x) - kappa, 0.) * jnp.exp(1j * jnp.angle(x))
+        return jnp.maximum(u - kappa, 0.) * jnp.exp(1j * jnp.angle(x))
     else:
-        return jnp.maximum(0, x - kappa) + jnp.minimum(0, x + kappa)
+        return jnp.sign(x) * jnp.maximum(u - kappa, 0.)
 
 def project_to_l1_ball(x, q=1.):
     """Projects a vector inside an l1 norm ball
@@ -136,15 +180,44 @@ def weighted_primal_l1_norm(x, w):
 def weighted_dual_linf_norm(x, w):
     return crn.norm_linf(x / w)
 
+def solution_dtype(A, b):
+    """Returns the data type for the solution vector
+
+    The precision follows that of b. The solution is complex if either
+    A or b is complex.
+    """
+    dtype = b.dtype
+    if not A.real:
+        dtype = jnp.result_type(dtype, jnp.complex64)
+    return dtype
+
 def obj_val(r):
     """ Objective value is half of squared norm of the residual
     """
-    return 0.5 * jnp.abs(jnp.vdot(r, r))
+    return 0.5 * crn.arr_rdot(r, r)
+
+def _r_g_f(A, b, x):
+    """Computes the residual, gradient and objective value at x
+    """
+    # residual
+    r = b - A.times(x)
+    # objective value
+    f = obj_val(r)
+    # gradient
+    g = -A.trans(r)
+    return r, g, f
 
 ############################################################################
 #  Curvilinear line search
 ############################################################################
 
+def _project_and_residual(A, b, x, proj, tau):
+    """Projects x to the ball and computes the residual at the projection
+    """
+    x = proj(x, tau)
+    r = b - A.times(x)
+    return x, r
+
 class CurvyLineSearchState(NamedTuple):
     """State for the line search algorithm
     """
@@ -159,6 +232,8 @@ class CurvyLineSearchState(NamedTuple):
     f_lim : float
     n_iters: int
     n_safe: int
+    n_times: int
+    "Number of multiplications with A"
 
     def __str__(self):
         """Returns the string representation of the state
@@ -178,34 +253,60 @@ class CurvyLineSearchState(NamedTuple):
             s.append(x.rstrip())
         return u' '.join(s)
 
-def curvy_line_search(A, b, x, g, alpha0, f_max, proj, tau, gamma):
+def curvy_line_search(A, b, x, r, g, alpha0, f_max, proj, tau, gamma):
     """curvilinear line search
+
+    If a trial point x - alpha g lies inside the l1 ball, no projection
+    is needed and its residual is obtained as r + alpha A g without
+    a fresh multiplication with A. Its directional derivative follows
+    from <g, g> without another inner product.
     """
     max_iters = 10
     g = alpha0 * g
     n = x.size
     n2 = math.sqrt(n)
-    g_norm = norm(g) / n2
-
+    g_sq = crn.arr_rdot(g, g)
+    g_norm = jnp.sqrt(g_sq) / n2
+    # if the full step stays inside the ball, so do all the shorter ones
+    full_inside = primal_norm(x - g) <= tau
+    # A g is needed only for unprojected trial points
+    Ag = lax.cond(full_inside,
+        lambda _: A.times(g),
+        lambda _: jnp.zeros_like(r),
+        None)
 
     def candidate(alpha, scale):
-        x_new = proj(x - alpha * scale * g, tau)
-        r_new = b - A.times(x_new)
-        d_new = x_new - x
-        gtd = scale * jnp.real(jnp.vdot(g, d_new))
+        step = alpha * scale
+        x_new = x - step * g
+        inside = jnp.logical_and(full_inside,
+            primal_norm(x_new) <= tau)
+        def projected(x_new):
+            x_new, r_new = _project_and_residual(A, b, x_new, proj, tau)
+            d_new = x_new - x
+            return x_new, r_new, d_new, crn.arr_rdot(g, d_new)
+
+        x_new, r_new, d_new, g_d = lax.cond(inside,
+            # d = -step g, residual is updated without multiplying with A
+            lambda x_new: (x_new, r + step * Ag, -step * g, -step * g_sq),
+            # project and compute the residual afresh
+            projected,
+            x_new)
+        gtd = scale * g_d
         f_val = obj_val(r_new)
         f_lim = f_max + gamma * alpha * gtd
-        return x_new, r_new, d_new, gtd, f_val, f_lim
+        n_times = 1 - inside
+        return x_new, r_new, d_new, gtd, f_val, f_lim, n_times
 
     def init():
         alpha = 1.
         scale = 1.
-        x_new, r_new, d_new, gtd, f_val, f_lim = candidate(alpha, scale)
+        x_new, r_new, d_new, gtd, f_val, f_lim, n_times = candidate(alpha, scale)
         return CurvyLineSearchState(alpha=alpha, scale=scale,
             x_new=x_new, r_new=r_new, d_new=d_new,
             gtd=gtd, d_norm_old=0.,
             f_val=f_val, f_lim=f_lim,
-            n_iters=0, n_safe=0)
+            n_iters=0, n_safe=0,
+            n_times=n_times + full_inside)
 
     def next_func(state):
         alpha = state.alpha
@@ -222,12 +323,13 @@ def curvy_line_search(A, b, x, g, alpha0, f_max, proj, tau, gamma):
             lambda _:  ((d_norm / g_norm / (2. ** n_safe)), n_safe + 1),
             lambda _: (scale, n_safe),
             None)
-        x_new, r_new, d_new, gtd, f_val, f_lim = candidate(alpha, scale)       
+        x_new, r_new, d_new, gtd, f_val, f_lim, n_times = candidate(alpha, scale)
         return CurvyLineSearchState(alpha=alpha, scale=scale,
             x_new=x_new, r_new=r_new, d_new=d_new, 
             gtd=gtd, d_norm_old=d_norm,
             f_val=f_val, f_lim=f_lim,
-            n_iters=state.n_iters+1, n_safe=n_safe)
+            n_iters=state.n_iters+1, n_safe=n_safe,
+            n_times=state.n_times + n_times)
 
     def cond_func(state):
         # print(state)
@@ -251,13 +353,33 @@ def curvy_line_search(A, b, x, g, alpha0, f_max, proj, tau, gamma):
 #  SPG-L1 Solver for LASSO problem
 ############################################################################
 
+def bb_step(x, x_old, g, g_old, alpha_min, alpha_max):
+    """Computes the Barzilai-Borwein spectral step length
+
+    Both inner products are taken against the same difference
+    s = x - x_old so that XLA can fuse them into a single sweep.
+    The sign test is a select rather than a branch.
+    """
+    s = x - x_old
+    sts = crn.arr_rdot(s, s)
+    sty = crn.arr_rdot(s, g - g_old)
+    return jnp.where(sty <= 0, alpha_max,
+        jnp.clip(sts / sty, alpha_min, alpha_max))
+
+def _update_f_past(f_past, f):
+    """Pushes a new function value into the memory and returns it with its maximum
+    """
+    f_past = crn.cbuf_push_left(f_past, f)
+    # a short branch-free reduction, fused into the loop body
+    return f_past, jnp.max(f_past)
+
 def lasso_metrics(b, x, g, r, f, tau):
     # dual norm of the gradient
     g_dnorm = dual_norm(g)
     # norm of the residual
     r_norm = norm(r)
     # duality gap
-    gap = jnp.dot(jnp.conj(r), r - b) + tau * g_dnorm
+    gap = jnp.vdot(r, r - b) + tau * g_dnorm
     # relative duality gap
     f_m = jnp.maximum(1, f)
     r_gap = jnp.abs(gap) / f_m
@@ -275,6 +397,8 @@ class SPGL1LassoState(NamedTuple):
     "residual vector"
     f_past: jnp.ndarray
     "Past function values"
+    f_max: float
+    "Maximum of the past function values"
     r_norm: float
     "Residual norm"
     r_gap: float
@@ -328,36 +452,33 @@ def solve_lasso_from(A,
 
     def init():
         x = jnp.asarray(x0)
-        x = project_to_l1_ball(x, tau)
-        # initial residual
-        r = b - A.times(x)
-        # initial gradient
-        g = -A.trans(r)
-        # objective value
-        f = obj_val(r)
+        x = _project_to_l1_ball(x, tau)
+        # initial residual, gradient and objective value
+        r, g, f = _r_g_f(A, b, x)
         # prepare the memory of past function values
-        f_past = jnp.full(options.memory, f)
+        f_past = jnp.full(options.memory, f, dtype=f.dtype)
+        f_max = f
         # projected gradient direction
-        d = project_to_l1_ball(x - g, tau) - x
+        d = _project_to_l1_ball(x - g, tau) - x
         # initial step length calculation
         d_norm = crn.norm_linf(d)
         alpha =  1. / d_norm
         alpha = jnp.clip(alpha, alpha_min, alpha_max)
         r_norm, r_gap = lasso_metrics(b, x, g, r, f, tau)
         return SPGL1LassoState(x=x, g=g, r=r, 
-            f_past=f_past,
+            f_past=f_past, f_max=f_max,
             r_norm=r_norm, r_gap=r_gap, alpha=alpha,
             alpha_next=alpha,
             iterations=1, n_times=1, n_trans=1,
             n_ls_iters=0)
 
     def body_func(state):
-        f_max = jnp.max(state.f_past)
-        lsearch = curvy_line_search(A, b, state.x, 
+        f_max = state.f_max
+        lsearch = curvy_line_search(A, b, state.x, state.r,
             state.g, state.alpha_next, f_max, 
-            project_to_l1_ball, tau,
+            _project_to_l1_ball, tau,
             options.gamma)
-        n_times = state.n_times + lsearch.n_iters + 1
+        n_times = state.n_times + lsearch.n_times
         # new x value
         x = lsearch.x_new
         # new residual
@@ -368,18 +489,11 @@ def solve_lasso_from(A,
         # new function value
         f = lsearch.f_val
         # update past values
-        f_past = crn.cbuf_push_left(state.f_past, f)
+        f_past, f_max = _update_f_past(state.f_past, f)
         r_norm, r_gap = lasso_metrics(b, x, g, r, f, tau)
-        s = x - state.x
-        y = g - state.g
-        sts = jnp.real(jnp.dot(jnp.conj(s), s))
-        sty = jnp.real(jnp.dot(jnp.conj(s), y))
-        alpha_next = lax.cond(sty <= 0,
-            lambda _: alpha_max,
-            lambda _: jnp.clip(sts / sty, alpha_min, alpha_max),
-            None)
+        alpha_next = bb_step(x, state.x, g, state.g, alpha_min, alpha_max)
         return SPGL1LassoState(x=x, g=g, r=r, 
-            f_past=f_past,
+            f_past=f_past, f_max=f_max,
             r_norm=r_norm, r_gap=r_gap, 
             alpha=lsearch.alpha,
             alpha_next=alpha_next,
@@ -410,14 +524,182 @@ def solve_lasso(A,
     options: SPGL1Options = SPGL1Options(),
     tracker=crs.noop_tracker):
     """Solves the LASSO problem using SPGL1 algorithm
+
+    If A is a small NumPy matrix, the problem is solved on the host
+    by :func:`solve_lasso_np`. Larger NumPy matrices are wrapped as
+    linear operators.
     """
+    if isinstance(A, np.ndarray):
+        if A.shape[1] <= HOST_MAX_N:
+            return solve_lasso_np(A, b, tau, options=options, tracker=tracker)
+        A = lop.matrix(jnp.asarray(A))
     m, n = A.shape
-    x0 = jnp.zeros(n)
+    x0 = jnp.zeros(n, dtype=solution_dtype(A, b))
     return solve_lasso_from(A, b, tau, x0, options=options, tracker=tracker)
 
 solve_lasso_jit = jit(solve_lasso, static_argnames=("A", "tracker"))
 
 
+############################################################################
+#  Host (NumPy) SPG-L1 Solver for small LASSO problems
+############################################################################
+
+def _np_project_to_l1_ball(x, q):
+    """Projects a vector inside an l1 norm ball on the host
+    """
+    u = np.abs(x)
+    if u.sum() <= q:
+        return x
+    # pivot-partition search for the shrinkage threshold
+    card = u.size
+    kappa = (u.sum() - q) / card
+    while True:
+        mask = u > kappa
+        card_new = np.count_nonzero(mask)
+        if card_new == 0 or card_new == card:
+            break
+        kappa = (u[mask].sum() - q) / card_new
+        card = card_new
+    kappa = max(kappa, 0.)
+    # perform shrinkage
+    if np.iscomplexobj(x):
+        return np.maximum(u - kappa, 0.) * np.exp(1j * np.angle(x))
+    return np.sign(x) * np.maximum(u - kappa, 0.)
+
+
+def _np_curvy_line_search(A, b, x, g, alpha0, f_max, tau, gamma):
+    """Curvilinear line search on the host
+
+    Mirrors :func:`curvy_line_search`.
+    """
+    max_iters = 10
+    g = alpha0 * g
+    n2 = math.sqrt(x.size)
+    g_norm = np.linalg.norm(g) / n2
+
+    def candidate(alpha, scale):
+        x_new = _np_project_to_l1_ball(x - alpha * scale * g, tau)
+        r_new = b - A @ x_new
+        d_new = x_new - x
+        gtd = scale * np.real(np.vdot(g, d_new))
+        f_val = 0.5 * np.abs(np.vdot(r_new, r_new))
+        f_lim = f_max + gamma * alpha * gtd
+        return x_new, r_new, d_new, gtd, f_val, f_lim
+
+    alpha = 1.
+    scale = 1.
+    d_norm_old = 0.
+    n_safe = 0
+    n_iters = 0
+    x_new, r_new, d_new, gtd, f_val, f_lim = candidate(alpha, scale)
+    while n_iters < max_iters and gtd < 0 and f_val >= f_lim:
+        # reduce alpha size
+        alpha /= 2.
+        # check if the iterates of x are too close to each other
+        d_norm = np.linalg.norm(d_new) / n2
+        if abs(d_norm - d_norm_old) <= 1e-6 * d_norm:
+            scale = d_norm / g_norm / (2. ** n_safe)
+            n_safe += 1
+        d_norm_old = d_norm
+        x_new, r_new, d_new, gtd, f_val, f_lim = candidate(alpha, scale)
+        n_iters += 1
+    return x_new, r_new, f_val, alpha, n_iters
+
+
+def solve_lasso_np(A, b, tau, x0=None,
+    options: SPGL1Options = SPGL1Options(), tracker=crs.noop_tracker):
+    """Solves the LASSO problem using SPGL1 algorithm on the host with NumPy
+
+    For small dense problems, the cost of dispatching each JAX operation
+    dominates the actual arithmetic. This solver mirrors
+    :func:`solve_lasso_from` but performs all computations with NumPy
+    on the host.
+
+    Args:
+        A (numpy.ndarray): A dense sensing matrix of shape (m, n)
+        b (numpy.ndarray): The measurement vector
+        tau (float): The limit on the l1-norm of the solution
+        x0 (numpy.ndarray): An initial solution (default zeros)
+        options (SPGL1Options): Options for the algorithm
+        tracker: Called with the state and the continuation flag
+            before every iteration, as in :func:`solve_lasso_from`
+
+    Returns:
+        (SPGL1LassoState): Solution state with NumPy arrays and scalars
+    """
+    A = np.asarray(A)
+    b = np.asarray(b)
+    m, n = A.shape
+    AH = A.conj().T
+    alpha_min = options.alpha_min
+    alpha_max = options.alpha_max
+    opt_tol = options.opt_tol
+    b_norm = np.linalg.norm(b)
+
+    def metrics(r, g, f):
+        # norm of the residual
+        r_norm = np.linalg.norm(r)
+        # relative duality gap
+        gap = np.vdot(r, r - b) + tau * np.max(np.abs(g))
+        r_gap = np.abs(gap) / max(1., f)
+        return r_norm, r_gap
+
+    def clip(alpha):
+        return min(max(alpha, alpha_min), alpha_max)
+
+    dtype = np.result_type(A, b)
+    x = np.zeros(n, dtype=dtype) if x0 is None else np.asarray(x0)
+    x = _np_project_to_l1_ball(x, tau)
+    # initial residual, gradient and objective value
+    r = b - A @ x
+    g = -(AH @ r)
+    f = 0.5 * np.abs(np.vdot(r, r))
+    f_past = np.full(options.memory, f)
+    # initial step length calculation
+    d_norm = np.max(np.abs(_np_project_to_l1_ball(x - g, tau) - x))
+    alpha = clip(1. / d_norm) if d_norm > 0 else alpha_max
+    alpha_next = alpha
+    r_norm, r_gap = metrics(r, g, f)
+    iterations, n_times, n_trans, n_ls_iters = 1, 1, 1, 0
+
+    def state():
+        return SPGL1LassoState(x=x, g=g, r=r,
+            f_past=f_past, f_max=np.max(f_past),
+            r_norm=r_norm, r_gap=r_gap,
+            alpha=alpha, alpha_next=alpha_next,
+            iterations=iterations,
+            n_times=n_times, n_trans=n_trans,
+            n_ls_iters=n_ls_iters)
+
+    def cond():
+        a = bool(iterations < options.max_iters and r_gap > opt_tol
+            and r_norm >= opt_tol * b_norm)
+        tracker(state(), more=a)
+        return a
+
+    while cond():
+        x_new, r, f, alpha, ls_iters = _np_curvy_line_search(A, b, x, g,
+            alpha_next, np.max(f_past), tau, options.gamma)
+        n_times += ls_iters + 1
+        n_ls_iters += ls_iters
+        # new gradient
+        g_new = -(AH @ r)
+        n_trans += 1
+        # update past values
+        f_past = np.roll(f_past, 1)
+        f_past[0] = f
+        r_norm, r_gap = metrics(r, g_new, f)
+        # Barzilai-Borwein step length
+        s = x_new - x
+        sts = np.real(np.vdot(s, s))
+        sty = np.real(np.vdot(s, g_new - g))
+        alpha_next = alpha_max if sty <= 0 else clip(sts / sty)
+        x, g = x_new, g_new
+        iterations += 1
+
+    return state()
+
+
 def analyze_lasso_state(A, b, tau, options, state, x0):
     m, n = A.shape
     x = state.x
@@ -462,6 +744,8 @@ class SPGL1BPState(NamedTuple):
     "residual vector"
     f_past: jnp.ndarray
     "Past function values"
+    f_max: float
+    "Maximum of the past function values"
     tau: float
     "The limit on the l1-norm"
     tau_changed: bool
@@ -539,23 +823,15 @@ def tau_change(A, r, r_norm, sigma):
     return change
 
 def compute_rgf(A, b, x):
-    # update residual
-    r = b - A.times(x)
-    # compute gradient
-    g = -A.trans(r)
-    # objective value
-    f = obj_val(r)
-    return r, g, f
+    """Computes the residual, gradient and objective value at x
+    """
+    return _r_g_f(A, b, x)
 
 def update_xrgf(A, b, x, tau):
     # bring x to this ball
-    x = project_to_l1_ball(x, tau)
-    # update residual
-    r = b - A.times(x)
-    # compute gradient
-    g = -A.trans(r)
-    # objective value
-    f = obj_val(r)
+    x = _project_to_l1_ball(x, tau)
+    # update residual, gradient and objective value
+    r, g, f = _r_g_f(A, b, x)
     return x, r, g, f
 
 def solve_bpic_from(A,
@@ -589,17 +865,18 @@ def solve_bpic_from(A,
         # g_dnorm, r_norm, r_gap, r_res_error, r_f_error = bpic_metrics(b, x, g, r, f, sigma, tau)
 
         # projected gradient direction
-        d = project_to_l1_ball(x - g, 0.) - x
+        d = _project_to_l1_ball(x - g, 0.) - x
         # initial step length calculation
         d_norm = crn.norm_linf(d)
         alpha =  1. / d_norm
         alpha = jnp.clip(alpha, alpha_min, alpha_max)
 
         # prepare the memory of past function values
-        f_past = jnp.full(options.memory, f)
+        f_past = jnp.full(options.memory, f, dtype=f.dtype)
+        f_max = f
 
         return SPGL1BPState(x=x, g=g, r=r, 
-            f_past=f_past,
+            f_past=f_past, f_max=f_max,
             tau=tau, tau_changed=True,
             r_norm=r_norm, r_gap=r_gap, 
             r_res_error=r_res_error, r_f_error=r_f_error,
@@ -610,13 +887,13 @@ def solve_bpic_from(A,
 
     #@jit
     def body_func(state):
-        f_max = jnp.max(state.f_past)
+        f_max = state.f_max
         # perform line search
-        lsearch = curvy_line_search(A, b, state.x, 
+        lsearch = curvy_line_search(A, b, state.x, state.r,
             state.g, state.alpha_next, f_max, 
-            project_to_l1_ball, state.tau,
+            _project_to_l1_ball, state.tau,
             options.gamma)
-        n_times = state.n_times + lsearch.n_iters + 1
+        n_times = state.n_times + lsearch.n_times
         # new x value
         x = lsearch.x_new
         # new residual
@@ -658,18 +935,11 @@ def solve_bpic_from(A,
         n_times, n_trans = n_times + tau_reduced, n_trans + tau_reduced
         n_newton = state.n_newton + change_tau
         # update past objective values with the new objective value
-        f_past = crn.cbuf_push_left(state.f_past, f)
+        f_past, f_max = _update_f_past(state.f_past, f)
         # compute the new step size
-        s = x - state.x
-        y = g - state.g
-        sts = jnp.real(jnp.vdot(s, s))
-        sty = jnp.real(jnp.vdot(s, y))
-        alpha_next = lax.cond(sty <= 0,
-            lambda _: alpha_max,
-            lambda _: jnp.clip(sts / sty, alpha_min, alpha_max),
-            None)
+        alpha_next = bb_step(x, state.x, g, state.g, alpha_min, alpha_max)
         return SPGL1BPState(x=x, g=g, r=r, 
-            f_past=f_past,
+            f_past=f_past, f_max=f_max,
             tau=tau, tau_changed=change_tau,
             r_norm=r_norm, r_gap=r_gap, 
             r_res_error=r_res_error, r_f_error=r_f_error,
@@ -704,10 +974,6 @@ def solve_bpic_from(A,
 
     state = init()
     state = lax.while_loop(cond_func, body_func, state)
-    # while cond_func(state):
-    #     print(state)
-    #     state = body_func(state)
-    # print(state)
     return state
 
 solve_bpic_from_jit = jit(solve_bpic_from, static_argnames=("A", "options", "tracker"))
@@ -720,7 +986,7 @@ def solve_bpic(A,
     """Solves the BPIC problem using SPGL1 algorithm
     """
     m, n = A.shape
-    x0 = jnp.zeros(n, dtype=b.dtype)
+    x0 = jnp.zeros(n, dtype=solution_dtype(A, b))
     return solve_bpic_from(A, b, sigma, x0, options=options, tracker=tracker)
 
 solve_bpic_jit = jit(solve_bpic, static_argnames=("A", "options", "tracker"))
@@ -773,8 +1039,7 @@ def solve_bp(A,
     * :ref:`gallery:0003`
     """
     m, n = A.shape
-    dtype = jnp.complex128 if not A.real else b.dtype
-    x0 = jnp.zeros(n, dtype=dtype)
+    x0 = jnp.zeros(n, dtype=solution_dtype(A, b))
     sigma = 0.
     return solve_bpic_from(A, b, sigma, x0, options=options, tracker=tracker)
 
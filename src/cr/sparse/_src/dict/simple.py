@@ -16,10 +16,9 @@ import math
 from functools import partial
 
 import numpy as np
-import scipy
 
 import jax.numpy as jnp
-from jax import random
+from jax import random, lax
 from jax import jit, vmap
 from jax.experimental import sparse
 
@@ -63,10 +62,11 @@ def gaussian_mtx(key, N, D, normalize_atoms=True):
     shape = (N, D)
     dict = random.normal(key, shape)
     if normalize_atoms:
-        dict = normalize_l2_cw(dict)
+        # one reduction and one scaling per column
+        scale = lax.rsqrt(jnp.sum(dict * dict, axis=0))
+        dict = dict * scale
     else:
-        sigma = math.sqrt(N)
-        dict = dict / sigma
+        dict = dict * (1. / math.sqrt(N))
     return dict
 
 def rademacher_mtx(key, M, N, normalize_atoms=True):
@@ -203,9 +203,11 @@ def hadamard(n, dtype=int):
     """
     lg2 = int(math.log(n, 2))
     assert 2**lg2 == n, "n must be positive integer and a power of 2"
-    H = jnp.array([[1]], dtype=dtype)
-    for _ in range(0, lg2):
-        H = jnp.vstack((jnp.hstack((H, H)), jnp.hstack((H, -H))))
+    # Sylvester construction in closed form: H[i, j] = (-1)^popcount(i & j)
+    i = jnp.arange(n, dtype=jnp.uint32)[:, None]
+    j = jnp.arange(n, dtype=jnp.uint32)[None, :]
+    parity = lax.population_count(i & j) & 1
+    H = 1 - 2 * parity.astype(dtype)
     return H
 
 def hadamard_basis(n):
@@ -217,6 +219,9 @@ def hadamard_basis(n):
 
 def dirac_hadamard_basis(n):
     """A dictionary consisting of identity basis and hadamard bases
+
+    See :func:`cr.sparse.lop.dirac_hadamard_basis` for an operator which applies
+    the identity block implicitly.
     """
     I = jnp.eye(n)
     H = hadamard_basis(n)
@@ -226,13 +231,18 @@ def dirac_hadamard_basis(n):
 def cosine_basis(N):
     """DCT Basis
     """
-    n, k = jnp.ogrid[1:2*N+1:2, :N]
-    D = 2 * jnp.cos(jnp.pi/(2*N) * n * k)
-    D = normalize_l2_cw(D)
+    n = jnp.arange(1, 2*N+1, 2)[:, None]
+    k = jnp.arange(N)[None, :]
+    # DCT-II column norms are known analytically
+    scale = jnp.where(k == 0, math.sqrt(1. / N), math.sqrt(2. / N))
+    D = scale * jnp.cos(jnp.pi/(2*N) * n * k)
     return D.T
 
 def dirac_cosine_basis(n):
     """A dictionary consisting of identity and DCT bases
+
+    See :func:`cr.sparse.lop.dirac_cosine_basis` for an operator which applies
+    the identity block implicitly.
     """
     I = jnp.eye(n)
     H = cosine_basis(n)
@@ -240,6 +250,9 @@ def dirac_cosine_basis(n):
 
 def dirac_hadamard_cosine_basis(n):
     """A dictionary consisting of identity, Hadamard and DCT bases
+
+    See :func:`cr.sparse.lop.dirac_hadamard_cosine_basis` for an operator which applies
+    the identity block implicitly.
     """
     I = jnp.eye(n)
     H = hadamard_basis(n)
@@ -250,9 +263,9 @@ def dirac_hadamard_cosine_basis(n):
 def fourier_basis(n):
     """Fourier basis
     """
-    F = scipy.linalg.dft(n) / math.sqrt(n)
-    # From numpy to jax
-    F = jnp.array(F)
+    # DFT matrix computed on the device
+    I = jnp.eye(n, dtype=complex)
+    F = jnp.fft.fft(I) / math.sqrt(n)
     # Perform conjugate transpose
     F = hermitian(F)
     return F
@@ -74,7 +74,6 @@ def fom(smooth_f, prox_h, A, b, x0, options: FomOptions = FomOptions()):
     * :math:`f : \RR^m \to \RR` is a *smooth* convex function.
     * :math:`h : \RR^n \to \RR` is a *prox-capable* convex function.
     """
-    #print(options)
     # add the offset b to the input of smooth function f
     smooth_f = opt.smooth_func_translate(smooth_f, b)
 
@@ -135,7 +134,6 @@ def fom(smooth_f, prox_h, A, b, x0, options: FomOptions = FomOptions()):
         L = state.L * options.alpha
         # update theta
         theta = advance_theta( state.theta, L, state.L)
-        #print(L, theta)
         # update y
         y = (1 - theta) * state.x + theta * state.z
         # compute A @ y
@@ -178,7 +176,4 @@ def fom(smooth_f, prox_h, A, b, x0, options: FomOptions = FomOptions()):
 
     state = body_func(state)
     state = lax.while_loop(outer_cond_func, body_func, state)
-    # while outer_cond_func(state):
-    #     state = body_func(state)
-    #     print(state.at_str)
     return state
@@ -14,13 +14,16 @@
 
 from functools import partial
 
+import numpy as np
 import jax.numpy as jnp
 
 from .impl import _hermitian
 from .lop import Operator
 
 
-FORWARD_DERIVATIVE_FILTER = jnp.array([1., -1.])
+# difference filters are host-side constants; jax converts them on first use
+FORWARD_DERIVATIVE_FILTER = np.array([1., -1.])
+SECOND_DERIVATIVE_FILTER = np.array([1., -2., 1.])
 
 def _derivative_fwd(x, dx):
     append = jnp.array([x[-1]])
@@ -69,7 +72,7 @@ def first_derivative(n, dx=1., kind='centered'):
 
 
 def second_derivative(n, dx=1.):
-    filter = jnp.array([1., -2., 1.]) / dx / dx
+    filter = SECOND_DERIVATIVE_FILTER / (dx * dx)
     times = lambda x : jnp.pad(jnp.convolve(x, filter, 'valid'), (1,1))
     trans = lambda x : jnp.convolve(x[1:-1], filter, 'full')
     return Operator(times=times, trans=trans, shape=(n,n))
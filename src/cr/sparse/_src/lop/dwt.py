@@ -14,7 +14,7 @@
 
 """Linear Operators based on Wavelet Transforms
 """
-from functools import partial
+from functools import partial, lru_cache
 
 import numpy as np
 from jax import jit, lax
@@ -26,6 +26,19 @@ from cr.nimble import promote_arg_dtypes
 from .lop import Operator
 from .util import apply_along_axis
 
+
+@lru_cache(maxsize=None)
+def _wavelet_by_name(name):
+    """Builds a named wavelet once and reuses it for later operators
+    """
+    return wt.to_wavelet(name)
+
+
+def _to_wavelet(wavelet):
+    if isinstance(wavelet, str):
+        return _wavelet_by_name(wavelet)
+    return wt.to_wavelet(wavelet)
+
 @partial(jit, static_argnums=(3,))
 def wavedec(data, dec_lo, dec_hi, level):
     """Compute multilevel wavelet decomposition
@@ -136,7 +149,7 @@ def dwt(n, wavelet="haar", level=1, axis=0, basis=False):
     Returns:
         Operator: A linear operator wrapping 1D DWT transform or basis
     """
-    wavelet = wt.to_wavelet(wavelet)
+    wavelet = _to_wavelet(wavelet)
     dec_lo = wavelet.dec_lo
     dec_hi = wavelet.dec_hi
     rec_lo = wavelet.rec_lo
@@ -181,7 +194,7 @@ def dwt2D(shape, wavelet="haar", level=1, axes=None, basis=False):
     Returns:
         Operator: A linear operator wrapping 2D DWT transform or basis
     """
-    wavelet = wt.to_wavelet(wavelet)
+    wavelet = _to_wavelet(wavelet)
     dec_lo = wavelet.dec_lo
     dec_hi = wavelet.dec_hi
     rec_lo = wavelet.rec_lo
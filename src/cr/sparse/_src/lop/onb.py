@@ -16,7 +16,7 @@ import jax.numpy as jnp
 import jax.numpy.fft as jfft
 
 from .impl import _hermitian
-from .lop import Operator
+from .lop import Operator, transpose
 
 import cr.sparse as crs
 import cr.nimble.dsp as crdsp
@@ -95,3 +95,68 @@ def walsh_hadamard_basis(n):
     times = lambda x: factor * crdsp.fwht(x)
     trans = times
     return Operator(times=times, trans=trans, shape=(n,n))
+
+
+def _sylvester_hadamard_basis(n):
+    """Returns an operator for the Hadamard basis in natural (Sylvester) order
+
+    :math:`H_n = H_2 \\otimes \\dots \\otimes H_2` is applied as one
+    2-point butterfly per binary digit of the index, in O(n log n).
+    The operator is self-adjoint.
+    """
+    assert crs.is_power_of_2(n), "Only powers of 2 are supported as n"
+    k = n.bit_length() - 1
+    factor = 1/jnp.sqrt(n)
+    H2 = jnp.array([[1., 1.], [1., -1.]])
+
+    def times(x):
+        y = jnp.reshape(x, (2,)*k + x.shape[1:])
+        for axis in range(k):
+            y = jnp.moveaxis(jnp.tensordot(H2, y, axes=(1, axis)), 0, axis)
+        return factor * jnp.reshape(y, x.shape)
+
+    return Operator(times=times, trans=times, shape=(n,n))
+
+
+def _dirac_plus(n, bases):
+    """Returns an operator for the dictionary :math:`[I, B_1, \\dots, B_k]`
+
+    The identity block is applied implicitly by slicing.
+    """
+    def times(x):
+        y = x[:n]
+        for i, B in enumerate(bases):
+            y = y + B.times(x[(i+1)*n:(i+2)*n])
+        return y
+
+    def trans(x):
+        return jnp.concatenate([x] + [B.trans(x) for B in bases], axis=0)
+
+    real = all(B.real for B in bases)
+    shape = (n, (len(bases)+1)*n)
+    return Operator(times=times, trans=trans, shape=shape, real=real)
+
+
+def dirac_hadamard_basis(n):
+    """Returns an operator for a two-ortho basis dictionary consisting of Dirac basis and Hadamard basis
+
+    The matrix representation is same as :func:`cr.sparse.dict.dirac_hadamard_basis`
+    """
+    return _dirac_plus(n, [_sylvester_hadamard_basis(n)])
+
+
+def dirac_cosine_basis(n):
+    """Returns an operator for a two-ortho basis dictionary consisting of Dirac basis and DCT basis
+
+    The matrix representation is same as :func:`cr.sparse.dict.dirac_cosine_basis`
+    """
+    return _dirac_plus(n, [transpose(cosine_basis(n))])
+
+
+def dirac_hadamard_cosine_basis(n):
+    """Returns an operator for a dictionary consisting of Dirac, Hadamard and DCT bases
+
+    The matrix representation is same as :func:`cr.sparse.dict.dirac_hadamard_cosine_basis`
+    """
+    return _dirac_plus(n, [_sylvester_hadamard_basis(n),
+        transpose(cosine_basis(n))])
@@ -51,6 +51,19 @@ def diff_adj_1d_circular(x):
     x1 = cnb.vec_rotate_right(x)
     return x1 - x
 
+# forward and adjoint 1D differences for each boundary condition
+_DIFF_1D = {
+    REGULAR: (diff_fwd_1d_regular, diff_adj_1d_regular),
+    DIRICHLET: (diff_fwd_1d_dirichlet, diff_adj_1d_dirichlet),
+    CIRCULAR: (diff_fwd_1d_circular, diff_adj_1d_circular),
+}
+
+def _diff_1d(kind):
+    try:
+        return _DIFF_1D[kind]
+    except KeyError:
+        raise NotImplementedError(f"The kind {kind} is not supported") from None
+
 def tv(n, kind='regular', axis=0):
     r"""Returns a total variation linear operator for 1D signals
 
@@ -68,17 +81,7 @@ def tv(n, kind='regular', axis=0):
         To compute the total variation, we first apply the linear operator 
         and then compute the norm of the variation.
     """
-    if kind == REGULAR:
-        times = diff_fwd_1d_regular
-        trans = diff_adj_1d_regular
-    elif kind == DIRICHLET:
-        times = diff_fwd_1d_dirichlet
-        trans = diff_adj_1d_dirichlet
-    elif kind == CIRCULAR:
-        times = diff_fwd_1d_circular
-        trans = diff_adj_1d_circular
-    else:
-        raise NotImplementedError(f"The kind {kind} is not supported")
+    times, trans = _diff_1d(kind)
     times, trans = apply_along_axis(times, trans, axis)
     return Operator(times=times, trans=trans, shape=(n,n))
 
@@ -101,17 +104,7 @@ def tv2D(shape, kind='regular'):
         To compute the total variation, we first apply the linear operator 
         and then compute the norm of the variation image.
     """
-    if kind == REGULAR:
-        times1d = diff_fwd_1d_regular
-        trans1d = diff_adj_1d_regular
-    elif kind == DIRICHLET:
-        times1d = diff_fwd_1d_dirichlet
-        trans1d = diff_adj_1d_dirichlet
-    elif kind == CIRCULAR:
-        times1d = diff_fwd_1d_circular
-        trans1d = diff_adj_1d_circular
-    else:
-        raise NotImplementedError(f"The kind {kind} is not supported")
+    times1d, trans1d = _diff_1d(kind)
 
     def times(X):
         """Forward total variation
@@ -12,33 +12,111 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import math
+
 import jax
-from jax import random
+from jax import random, lax
 import jax.numpy as jnp
 
 import cr.nimble as cnb
 
-def to_matrix(A):
-    """Converts a linear operator to a matrix"""
-    n = A.input_size
+
+def _identity_block(n, start, chunk):
+    """Returns the columns start, ..., start + chunk - 1 of an n x n identity
+
+    Columns beyond n are zero.
+    """
+    rows = jnp.arange(n)[:, None]
+    cols = start + jnp.arange(chunk)[None, :]
+    return jnp.where(rows == cols, 1., 0.)
+
+
+def _flat(func, shape):
+    """Wraps a function on arrays of the given shape to act on flattened vectors
+    """
+    if len(shape) == 1:
+        return func
+    return lambda x: func(jnp.reshape(x, shape)).flatten()
+
+
+def _apply_to_identity(func, shape, chunk):
+    """Applies a function to all columns of an n x n identity matrix
+
+    ``func`` acts on arrays of the given shape, whose size is n.
+    The columns are processed in blocks of ``chunk`` columns so that
+    neither the identity nor the batched intermediate results ever
+    need more than O(n chunk) memory.
+    """
+    func = _flat(func, shape)
+    n = math.prod(shape)
+    n_chunks = math.ceil(n / chunk)
+    starts = jnp.arange(n_chunks) * chunk
+    apply_block = lambda start: jax.vmap(func, (1), (0))(
+        _identity_block(n, start, chunk))
+    # shape: (n_chunks, chunk, output shape)
+    Y = lax.map(apply_block, starts)
+    Y = jnp.reshape(Y, (n_chunks * chunk,) + Y.shape[2:])[:n]
+    # the columns go to the second axis
+    return jnp.moveaxis(Y, 0, 1)
+
+# keyed on the operator's own times/trans and the static shape,
+# so repeated calls on the same operator reuse the compiled code
+_apply_to_identity_jit = jax.jit(_apply_to_identity, static_argnums=(0, 1, 2))
+
+
+def _apply_to_identity_eager(func, shape, chunk):
+    """Applies a function to all columns of an n x n identity matrix block by block
+
+    For operators which are not JIT safe, ``func`` is only vmapped,
+    never traced under ``jit`` or ``lax.map``.
+    """
+    func = _flat(func, shape)
+    n = math.prod(shape)
+    blocks = [jax.vmap(func, (1), (1))(_identity_block(n, start, min(chunk, n - start)))
+        for start in range(0, n, chunk)]
+    return jnp.concatenate(blocks, axis=1)
+
+
+def _densify(A, func, shape, chunk):
+    """Applies func (A.times or A.trans) to all columns of an identity matrix
+    """
+    shape = tuple(shape)
+    n = math.prod(shape)
+    if n <= chunk:
+        # a single block: nothing to save, so no compilation either
+        return jax.vmap(_flat(func, shape), (1), (1))(jnp.eye(n))
+    if A.jit_safe:
+        return _apply_to_identity_jit(func, shape, chunk)
+    return _apply_to_identity_eager(func, shape, chunk)
+
+
+def to_matrix(A, chunk=512):
+    """Converts a linear operator to a matrix
+
+    Args:
+        A (Operator): A linear operator
+        chunk (int): Number of columns computed together in one batch
+
+    Returns:
+        (jax.numpy.ndarray): Matrix representation of the linear operator
+    """
     if not A.linear:
         raise Exception("This operator is not linear.")
-    I = jnp.eye(n)
-    times = A.times
-    if A.input_ndim > 1:
-        times = lambda x: A.times(jnp.reshape(x, A.input_shape)).flatten()
-    return jax.vmap(times, (1), (1))(I)
-
-def to_adjoint_matrix(A):
-    """Converts the adjoint of a linear operator to a matrix"""
+    return _densify(A, A.times, A.input_shape, chunk)
+
+def to_adjoint_matrix(A, chunk=512):
+    """Converts the adjoint of a linear operator to a matrix
+
+    Args:
+        A (Operator): A linear operator
+        chunk (int): Number of columns computed together in one batch
+
+    Returns:
+        (jax.numpy.ndarray): Matrix representation of the adjoint
+    """
     if not A.linear:
         raise Exception("This operator is not linear.")
-    m = A.output_size
-    I = jnp.eye(m)
-    trans =  A.trans
-    if A.output_ndim > 1:
-        trans = lambda x: A.trans(jnp.reshape(x, A.output_shape)).flatten()
-    return jax.vmap(trans, (1), (1))(I)
+    return _densify(A, A.trans, A.output_shape, chunk)
 
 
 def to_complex_matrix(A):
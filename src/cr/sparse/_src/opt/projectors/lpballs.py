@@ -166,8 +166,9 @@ def proj_l1_ball(q=1., b=None):
         cu_diff = cu - q
         u_scaled = u*jnp.arange(1, 1+len(u))
         flags = cu_diff > u_scaled
-        K = jnp.argmax(flags)
-        K = jnp.where(K == 0, len(flags), K)
+        # flags is a run of falses followed by trues,
+        # the number of falses is the size of the support
+        K = jnp.sum(~flags)
         # compute the shrinkage threshold
         kappa = (cu[K-1] - q)/K
         # perform shrinkage
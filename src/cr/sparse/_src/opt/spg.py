@@ -28,6 +28,7 @@ SIAM Journal on Optimization 10.4 (2000): 1196-1211.
 
 from typing import NamedTuple, Callable
 
+import numpy as np
 from numpy import array_str
 from jax import lax, jit, device_get
 import jax.numpy as jnp
@@ -35,7 +36,7 @@ import jax.numpy as jnp
 import cr.nimble as crn
 from cr.sparse.opt import SmoothFunction
 
-EPS = jnp.finfo(jnp.float32).eps
+EPS = float(np.finfo(np.float32).eps)
 
 L_MIN = 1e-10
 L_MAX = 1e10
@@ -13,6 +13,9 @@
 # limitations under the License.
 
 
+from functools import partial
+
+import numpy as np
 import jax
 import jax.numpy as jnp
 from jax import vmap, jit, lax
@@ -20,93 +23,200 @@ from jax import vmap, jit, lax
 
 from .defs import RecoverySolution, CoSaMPState
 
-from .util import largest_indices
+from .util import (precompute, HOST_MAX_N,
+    largest_indices, _largest_indices_excluding, solve_normal_eqs,
+    _solve_gram, _gram_res_norm_sqr, _merge_indices, _iterate,
+    _np_largest_indices, _np_largest_indices_excluding, _np_solve_normal_eqs)
 import cr.sparse as crs
 
 EXTRA_FACTOR = 2
 
 
-def matrix_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4):
-    r"""Solves the sparse recovery problem :math:`y = \Phi x + e` using Compressive Sampling Matching Pursuit for matrices
+def precomputed_solve(pre, y, K, max_iters=None, res_norm_rtol=1e-4):
+    r"""Solves the sparse recovery problem :math:`y = \Phi x + e` using Compressive Sampling Matching Pursuit with a precomputed Gram matrix
+
+    Args:
+        pre (GramData): Phi and its Gram matrix from :func:`cr.sparse.pursuit.precompute`
     """
+    Phi, G = pre.Phi, pre.G
+    # work in the precision of the Gram matrix
+    y = y.astype(G.dtype)
     M = y.shape[0]
     ## Initialize some constants for the algorithm
     K2 = EXTRA_FACTOR * K
     K3 = K + K2
+    # buffer for the combined 3K index set
+    I_3k_buf = jnp.zeros(K3, dtype=jnp.int32)
     # squared norm of the signal
     y_norm_sqr = y.T @ y
 
     max_r_norm_sqr = y_norm_sqr * (res_norm_rtol ** 2) 
 
+    # correlations with y are shared by all iterations
+    Phit_y = Phi.T @ y
+
     if max_iters is None:
         max_iters = M 
 
-    min_iters = min(3*K, 20) 
+    def init():
+        # Data for the previous approximation [r = y, x = 0]
+        I_prev = jnp.arange(0, K, dtype=jnp.int32)
+        # compute the correlations of atoms with signal y
+        h = Phit_y
+        # Pick largest 3K indices [this is first iteration]
+        I_3k = largest_indices(h, K3)
+        G_3I = G[jnp.ix_(I_3k, I_3k)]
+        Phit_y_3I = Phit_y[I_3k]
+        # Solve least squares over the selected indices
+        x_3I = _solve_gram(G_3I, Phit_y_3I)
+        # pick the K largest indices
+        Ia = largest_indices(x_3I, K)
+        # keep the selected atoms in sorted order
+        Ia = Ia[jnp.argsort(I_3k[Ia])]
+        # Identify indices for corresponding atoms
+        I = I_3k[Ia]
+        # Corresponding non-zero entries in the sparse approximation
+        x_I = x_3I[Ia]
+        # Compute residual norm squared without forming the residual
+        r_norm_sqr = _gram_res_norm_sqr(Phi, y, y_norm_sqr, I, x_I,
+            G_3I[jnp.ix_(Ia, Ia)], Phit_y_3I[Ia])
+        # Assemble the algorithm state at the end of first iteration
+        return CoSaMPState(x_I=x_I, I=I, r=None, r_norm_sqr=r_norm_sqr, 
+            iterations=1,
+            I_prev=I_prev)
+
+    def body(state):
+        I_prev = state.I
+        # Index set of atoms for current solution
+        I = state.I
+        # compute the correlations of dictionary atoms with the residual
+        h = Phit_y - G[:, I] @ state.x_I
+        # Pick largest 2K indices ignoring the previously selected atoms
+        I_2k = _largest_indices_excluding(h, I, K2)
+        # Combine with previous K indices to form a set of 3K indices
+        I_3k = _merge_indices(I_3k_buf, I, I_2k)
+        G_3I = G[jnp.ix_(I_3k, I_3k)]
+        Phit_y_3I = Phit_y[I_3k]
+        # Solve least squares over the selected indices
+        x_3I = _solve_gram(G_3I, Phit_y_3I)
+        # pick the K largest indices
+        Ia = largest_indices(x_3I, K)
+        # Identify indices for corresponding atoms
+        I = I_3k[Ia]
+        # Corresponding non-zero entries in the sparse approximation
+        x_I = x_3I[Ia]
+        # Compute residual norm squared without forming the residual
+        r_norm_sqr = _gram_res_norm_sqr(Phi, y, y_norm_sqr, I, x_I,
+            G_3I[jnp.ix_(Ia, Ia)], Phit_y_3I[Ia])
+        return CoSaMPState(x_I=x_I, I=I, r=None, r_norm_sqr=r_norm_sqr, 
+            iterations=state.iterations+1,
+            I_prev=I_prev)
+
+    def cond(state):
+        # limit on residual norm 
+        a = state.r_norm_sqr > max_r_norm_sqr
+        # limit on number of iterations
+        b = state.iterations < max_iters
+        c = jnp.logical_and(a, b)
+        return c
+
+    state = _iterate(cond, body, init(), max_iters)
+    # residual is computed only once at the end
+    r = y - Phi[:, state.I] @ state.x_I
+    return RecoverySolution(x_I=state.x_I, I=state.I, r=r, r_norm_sqr=r.T @ r,
+        iterations=state.iterations, length=Phi.shape[1])
+
+
+precomputed_solve_jit = jit(precomputed_solve, static_argnums=(2,),
+    static_argnames=("max_iters", "res_norm_rtol"))
+
+
+def matrix_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4, dtype=None):
+    r"""Solves the sparse recovery problem :math:`y = \Phi x + e` using Compressive Sampling Matching Pursuit for matrices
+
+    The residual is correlated with Phi directly in every iteration.
+    To share the Gram matrix of Phi across many signals, see
+    :func:`precomputed_solve` and :func:`matrix_solve_multi`.
+
+    If ``dtype`` is given, Phi is cast to it before solving (with y and the
+    least squares solves in at least single precision). Otherwise, if Phi
+    is a small NumPy matrix, the problem is solved on the host by
+    :func:`matrix_solve_np`.
+    """
+    if dtype is None and isinstance(Phi, np.ndarray) and Phi.shape[1] <= HOST_MAX_N:
+        return matrix_solve_np(Phi, y, K, max_iters=max_iters, res_norm_rtol=res_norm_rtol)
+    if dtype is not None:
+        Phi = Phi.astype(dtype)
+        y = y.astype(jnp.promote_types(dtype, jnp.float32))
+    M, N = Phi.shape
+    ## Initialize some constants for the algorithm
+    K2 = EXTRA_FACTOR * K
+    K3 = K + K2
+    # buffer for the combined 3K index set
+    I_3k_buf = jnp.zeros(K3, dtype=jnp.int32)
+    # squared norm of the signal
+    y_norm_sqr = y.T @ y
+
+    max_r_norm_sqr = y_norm_sqr * (res_norm_rtol ** 2) 
+
+    if max_iters is None:
+        max_iters = M 
 
     def init():
         # Data for the previous approximation [r = y, x = 0]
-        I_prev = jnp.arange(0, K)
-        x_I_prev = jnp.zeros(K)
-        r_norm_sqr_prev = y_norm_sqr
+        I_prev = jnp.arange(0, K, dtype=jnp.int32)
         # compute the correlations of atoms with signal y
         h = Phi.T @ y
         # Pick largest 3K indices [this is first iteration]
         I_3k = largest_indices(h, K3)
         # Pick corresponding atoms to form the 3K wide subdictionary
-        Phi_3I = Phi[:,I_3k]
+        Phi_3I = Phi[:, I_3k]
         # Solve least squares over the selected indices
-        x_3I, _, _, _ = jnp.linalg.lstsq(Phi_3I, y)
+        x_3I = solve_normal_eqs(Phi_3I, y)
         # pick the K largest indices
         Ia = largest_indices(x_3I, K)
+        # keep the selected atoms in sorted order
+        Ia = Ia[jnp.argsort(I_3k[Ia])]
         # Identify indices for corresponding atoms
-        I = jnp.sort(I_3k[Ia])
+        I = I_3k[Ia]
         # Corresponding non-zero entries in the sparse approximation
         x_I = x_3I[Ia]
-        # Form the subdictionary of corresponding atoms
-        Phi_I = Phi[:, I]
         # Compute new residual
-        r = y - Phi_I @ x_I
+        r = y - Phi_3I[:, Ia] @ x_I
         # Compute residual norm squared
         r_norm_sqr = r.T @ r
         # Assemble the algorithm state at the end of first iteration
         return CoSaMPState(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, 
             iterations=1,
-            I_prev=I_prev, x_I_prev=x_I_prev, r_norm_sqr_prev=r_norm_sqr_prev)
+            I_prev=I_prev)
 
     def body(state):
         I_prev = state.I
-        x_I_prev = state.x_I
-        r_norm_sqr_prev = state.r_norm_sqr
         # Index set of atoms for current solution
         I = state.I
         # compute the correlations of dictionary atoms with the residual
         h = Phi.T @ state.r
-        # Ignore the previously selected atoms
-        h = h.at[I].set(0)
-        # Pick largest 2K indices
-        I_2k = largest_indices(h, K2)
+        # Pick largest 2K indices ignoring the previously selected atoms
+        I_2k = _largest_indices_excluding(h, I, K2)
         # Combine with previous K indices to form a set of 3K indices
-        I_3k = jnp.hstack((I, I_2k))
+        I_3k = _merge_indices(I_3k_buf, I, I_2k)
         # Pick corresponding atoms to form the 3K wide subdictionary
         Phi_3I = Phi[:, I_3k]
         # Solve least squares over the selected indices
-        x_3I, r_3I_norms, rank_3I, s_3I = jnp.linalg.lstsq(Phi_3I, y)
+        x_3I = solve_normal_eqs(Phi_3I, y)
         # pick the K largest indices
         Ia = largest_indices(x_3I, K)
         # Identify indices for corresponding atoms
         I = I_3k[Ia]
         # Corresponding non-zero entries in the sparse approximation
         x_I = x_3I[Ia]
-        # Form the subdictionary of corresponding atoms
-        Phi_I = Phi[:, I]
         # Compute new residual
-        r = y - Phi_I @ x_I
+        r = y - Phi_3I[:, Ia] @ x_I
         # Compute residual norm squared
         r_norm_sqr = r.T @ r
         return CoSaMPState(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, 
             iterations=state.iterations+1,
-            I_prev=I_prev, x_I_prev=x_I_prev, r_norm_sqr_prev=r_norm_sqr_prev
-            )
+            I_prev=I_prev)
 
     def cond(state):
         # limit on residual norm 
@@ -116,12 +226,71 @@ def matrix_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4):
         c = jnp.logical_and(a, b)
         return c
 
-    state = lax.while_loop(cond, body, init())
+    state = _iterate(cond, body, init(), max_iters)
     return RecoverySolution(x_I=state.x_I, I=state.I, r=state.r, r_norm_sqr=state.r_norm_sqr,
-        iterations=state.iterations, length=Phi.shape[1])
+        iterations=state.iterations, length=N)
+
+
+matrix_solve_jit = jit(matrix_solve, static_argnums=(2,),
+    static_argnames=("max_iters", "res_norm_rtol", "dtype"))
 
 
-matrix_solve_jit = jit(matrix_solve, static_argnums=(2,), static_argnames=("max_iters", "res_norm_rtol"))
+def matrix_solve_multi(Phi, Y, K, max_iters=None, res_norm_rtol=1e-4, dtype=None):
+    """Solves the MMV recovery problem :math:`Y = \\Phi X + E` using Compressive Sampling Matching Pursuit
+
+    Extends :py:func:`cr.sparse.pursuit.cosamp.precomputed_solve` to each column of Y
+    using :py:func:`jax.vmap`. The Gram matrix of Phi is computed once for all columns.
+    """
+    solve = partial(precomputed_solve, precompute(Phi, dtype), K=K, max_iters=max_iters,
+        res_norm_rtol=res_norm_rtol)
+    return vmap(solve, 1, 0)(Y)
+
+matrix_solve_multi = jit(matrix_solve_multi, static_argnums=(2,),
+    static_argnames=("max_iters", "res_norm_rtol", "dtype"))
+
+def matrix_solve_np(Phi, y, K, max_iters=None, res_norm_rtol=1e-4):
+    r"""Solves the sparse recovery problem :math:`y = \Phi x + e` using Compressive Sampling Matching Pursuit on the host
+
+    A NumPy version of :func:`matrix_solve` for small problems where
+    the per-operation JAX dispatch costs more than the arithmetic.
+    """
+    Phi = np.asarray(Phi)
+    y = np.asarray(y)
+    M, N = Phi.shape
+    K2 = EXTRA_FACTOR * K
+    K3 = K + K2
+    # squared norm of the signal
+    y_norm_sqr = y @ y
+    max_r_norm_sqr = y_norm_sqr * (res_norm_rtol ** 2)
+    if max_iters is None:
+        max_iters = M
+
+    def select(I_3k):
+        # least squares over the 3K candidates and pruning to K atoms
+        Phi_3I = Phi[:, I_3k]
+        x_3I = _np_solve_normal_eqs(Phi_3I, y)
+        Ia = _np_largest_indices(x_3I, K)
+        return Ia, x_3I[Ia], y - Phi_3I[:, Ia] @ x_3I[Ia]
+
+    # first iteration
+    I_3k = _np_largest_indices(Phi.T @ y, K3)
+    Ia, x_I, r = select(I_3k)
+    # keep the selected atoms in sorted order
+    order = np.argsort(I_3k[Ia])
+    I, x_I = I_3k[Ia][order], x_I[order]
+    r_norm_sqr = r @ r
+    iterations = 1
+    while r_norm_sqr > max_r_norm_sqr and iterations < max_iters:
+        # correlations with the residual ignoring the previously selected atoms
+        h = Phi.T @ r
+        I_3k = np.concatenate((I, _np_largest_indices_excluding(h, I, K2)))
+        Ia, x_I, r = select(I_3k)
+        I = I_3k[Ia]
+        r_norm_sqr = r @ r
+        iterations += 1
+    return RecoverySolution(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr,
+        iterations=iterations, length=N)
+
 
 def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
     tracker=crs.noop_tracker):
@@ -139,6 +308,8 @@ def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
     ## Initialize some constants for the algorithm
     K2 = EXTRA_FACTOR * K
     K3 = K + K2
+    # buffer for the combined 3K index set
+    I_3k_buf = jnp.zeros(K3, dtype=jnp.int32)
     # squared norm of the signal
     y_norm_sqr = jnp.abs(jnp.vdot(y, y))
     y_norm = jnp.sqrt(y_norm_sqr)
@@ -146,7 +317,6 @@ def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
     scale = 1.0 / y_norm
     y = scale * y
 
-    dtype = jnp.float64 if Phi.real else jnp.complex128
 
     max_r_norm_sqr = (res_norm_rtol ** 2)
 
@@ -157,9 +327,7 @@ def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
 
     def init():
         # Data for the previous approximation [r = y, x = 0]
-        I_prev = jnp.arange(0, K)
-        x_I_prev = jnp.zeros(K, dtype=dtype)
-        r_norm_sqr_prev = 1.
+        I_prev = jnp.arange(0, K, dtype=jnp.int32)
         # compute the correlations of atoms with signal y
         h = trans(y)
         # Pick largest 3K indices [this is first iteration]
@@ -167,15 +335,17 @@ def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
         # Pick corresponding atoms to form the 3K wide subdictionary
         Phi_3I = Phi.columns(I_3k)
         # Solve least squares over the selected indices
-        x_3I, r_3I_norms, rank_3I, s_3I = jnp.linalg.lstsq(Phi_3I, y)
+        x_3I = solve_normal_eqs(Phi_3I, y)
         # pick the K largest indices
         Ia = largest_indices(x_3I, K)
+        # keep the selected atoms in sorted order
+        Ia = Ia[jnp.argsort(I_3k[Ia])]
         # Identify indices for corresponding atoms
-        I = jnp.sort(I_3k[Ia])
+        I = I_3k[Ia]
         # Corresponding non-zero entries in the sparse approximation
         x_I = x_3I[Ia]
-        # Form the subdictionary of corresponding atoms
-        Phi_I = Phi.columns(I)
+        # The corresponding atoms are already in the 3K wide subdictionary
+        Phi_I = Phi_3I[:, Ia]
         # Compute new residual
         r = y - Phi_I @ x_I
         # Compute residual norm squared
@@ -183,42 +353,37 @@ def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
         # Assemble the algorithm state at the end of first iteration
         return CoSaMPState(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, 
             iterations=1,
-            I_prev=I_prev, x_I_prev=x_I_prev, r_norm_sqr_prev=r_norm_sqr_prev)
+            I_prev=I_prev)
 
     def body(state):
         I_prev = state.I
-        x_I_prev = state.x_I
-        r_norm_sqr_prev = state.r_norm_sqr
         # Index set of atoms for current solution
         I = state.I
         # compute the correlations of dictionary atoms with the residual
         h = trans(state.r)
-        # Ignore the previously selected atoms
-        h = h.at[I].set(0)
-        # Pick largest 2K indices
-        I_2k = largest_indices(h, K2)
+        # Pick largest 2K indices ignoring the previously selected atoms
+        I_2k = _largest_indices_excluding(h, I, K2)
         # Combine with previous K indices to form a set of 3K indices
-        I_3k = jnp.hstack((I, I_2k))
+        I_3k = _merge_indices(I_3k_buf, I, I_2k)
         # Pick corresponding atoms to form the 3K wide subdictionary
         Phi_3I = Phi.columns(I_3k)
         # Solve least squares over the selected indices
-        x_3I, r_3I_norms, rank_3I, s_3I = jnp.linalg.lstsq(Phi_3I, y)
+        x_3I = solve_normal_eqs(Phi_3I, y)
         # pick the K largest indices
         Ia = largest_indices(x_3I, K)
         # Identify indices for corresponding atoms
         I = I_3k[Ia]
         # Corresponding non-zero entries in the sparse approximation
         x_I = x_3I[Ia]
-        # Form the subdictionary of corresponding atoms
-        Phi_I = Phi.columns(I)
+        # The corresponding atoms are already in the 3K wide subdictionary
+        Phi_I = Phi_3I[:, Ia]
         # Compute new residual
         r = y - Phi_I @ x_I
         # Compute residual norm squared
         r_norm_sqr = jnp.abs(jnp.vdot(r, r))
         return CoSaMPState(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, 
             iterations=state.iterations+1,
-            I_prev=I_prev, x_I_prev=x_I_prev, r_norm_sqr_prev=r_norm_sqr_prev
-            )
+            I_prev=I_prev)
 
     def cond(state):
         # limit on residual norm 
@@ -231,15 +396,12 @@ def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
         # consider support change only after some iterations
         d = jnp.logical_or(state.iterations < min_iters, d)
         c = jnp.logical_and(c, d)
-        # there should be some reduction in the residual norm
-        # e = state.r_norm_sqr < 0.9 * state.r_norm_sqr_prev
-        # c = jnp.logical_and(c, e)
         # overall condition
         jax.debug.callback(tracker, state, more=c)
         return c
 
     state = init()
-    state = lax.while_loop(cond, body, state)
+    state = _iterate(cond, body, state, max_iters)
     # while cond(state):
     #     state = body(state)
 
@@ -251,6 +413,7 @@ def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
         iterations=state.iterations, length=Phi.shape[1])
 
 
-operator_solve_jit = jit(operator_solve, static_argnums=(0, 2), static_argnames=("max_iters", "res_norm_rtol"))
+operator_solve_jit = jit(operator_solve, static_argnums=(0, 2),
+    static_argnames=("max_iters", "res_norm_rtol", "tracker"))
 
 solve = operator_solve_jit
@@ -100,6 +100,19 @@ class RecoverySolution(NamedTuple):
         return u'\n'.join(s)
 
 
+class GramData(NamedTuple):
+    """A dictionary together with its Gram matrix, shared by repeated recoveries
+
+    See :func:`cr.sparse.pursuit.precompute`.
+    """
+    Phi: jnp.ndarray
+    """The dictionary/sensing matrix"""
+    G: jnp.ndarray
+    """The Gram matrix :math:`\\Phi^T \\Phi`"""
+    upper_frame_bound: jnp.ndarray
+    """The largest singular value of :math:`\\Phi`"""
+
+
 class PTConfig(NamedTuple):
     K: int
     M: int
@@ -122,15 +135,14 @@ class HTPState(NamedTuple):
     I: jnp.ndarray
     """The support for non-zero values"""
     r: jnp.ndarray
-    """The residuals"""
+    """The residuals (None if only the norm is tracked)"""
     r_norm_sqr: jnp.ndarray
     """The residual norm squared"""
     iterations: int
     """The number of iterations it took to complete"""
     # Information from previous iteration
     I_prev: jnp.ndarray
-    x_I_prev: jnp.ndarray
-    r_norm_sqr_prev: jnp.ndarray
+    """The support in the previous iteration"""
 
     def __str__(self):
         """Returns the string representation
@@ -139,7 +151,6 @@ class HTPState(NamedTuple):
         for x in [
             u"iterations %s" % self.iterations,
             u"r_norm_sqr %e" % self.r_norm_sqr,
-            # u"r_norm_sqr_prev %e" % self.r_norm_sqr_prev,
             # u"I %s" % self.I,
             # u"I_prev %s" % self.I_prev,
             ]:
@@ -12,23 +12,149 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from functools import partial
+
+import numpy as np
 import jax.numpy as jnp
 from jax import vmap, jit, lax
 
 
 from .defs import RecoverySolution, HTPState
-
-from cr.nimble.dsp import (hard_threshold, 
+from .util import (precompute, HOST_MAX_N,
+    hard_threshold,
     hard_threshold_sorted,
-    build_signal_from_indices_and_values)
+    solve_normal_eqs, _solve_gram, _gram_res_norm_sqr, _iterate,
+    _np_largest_indices, _np_solve_normal_eqs)
+
+from cr.nimble.dsp import build_signal_from_indices_and_values
 
 import cr.sparse.dict as crdict
 import cr.sparse.lop as lop
 
 
-def matrix_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None, res_norm_rtol=1e-4):
+def precomputed_solve(pre, y, K, normalized=False, step_size=None, max_iters=None, res_norm_rtol=1e-4):
+    """Solves the sparse recovery problem :math:`y = \\Phi x + e` using Hard Thresholding Pursuit with a precomputed Gram matrix
+
+    Args:
+        pre (GramData): Phi and its Gram matrix from :func:`cr.sparse.pursuit.precompute`
+    """
+    Phi, G = pre.Phi, pre.G
+    # work in the precision of the Gram matrix
+    y = y.astype(G.dtype)
+    ## Initialize some constants for the algorithm
+    M, N = Phi.shape
+
+    # squared norm of the signal
+    y_norm_sqr = y.T @ y
+
+    max_r_norm_sqr = y_norm_sqr * (res_norm_rtol ** 2)
+
+    # correlations with y are shared by all iterations
+    Phit_y = Phi.T @ y
+
+    if not normalized and step_size is None:
+        step_size = 0.98 / pre.upper_frame_bound
+
+    if max_iters is None:
+        max_iters = M
+
+    min_iters = min(3*K, 20) 
+
+    def compute_step_size(h, I):
+        h_I = h[I]
+        # Step size calculation: |Phi_I h_I|^2 = h_I^T G_II h_I
+        G_I = G[jnp.ix_(I, I)]
+        mu = h_I.T @ h_I / (h_I.T @ (G_I @ h_I))
+        return mu
+
+    def get_step_size(h, I):
+        return compute_step_size(h, I) if normalized else step_size
+
+    def init():
+        # Data for the previous approximation [r = y, x = 0]
+        I_prev = jnp.arange(0, K, dtype=jnp.int32)
+        # Assume previous estimate to be zero and conduct first iteration
+        # compute the correlations of atoms with signal y
+        h = Phit_y
+        mu = get_step_size(h, I_prev)
+        # update
+        x = mu * h
+        # threshold
+        I, x_I = hard_threshold(x, K)
+        # Compute residual norm squared without forming the residual
+        r_norm_sqr = _gram_res_norm_sqr(Phi, y, y_norm_sqr, I, x_I,
+            G[jnp.ix_(I, I)], Phit_y[I])
+        return HTPState(x_I=x_I, I=I, r=None, r_norm_sqr=r_norm_sqr, 
+            iterations=1,
+            I_prev=I_prev)
+
+    def iteration(state):
+        I_prev = state.I
+        # compute the correlations of dictionary atoms with the residual
+        h = Phit_y - G[:, state.I] @ state.x_I
+        # current approximation
+        x = build_signal_from_indices_and_values(N, state.I, state.x_I)
+        # Step size calculation
+        mu = get_step_size(h, I_prev)
+        # update
+        x = x + mu * h
+        # threshold
+        I, x_I = hard_threshold_sorted(x, K)
+        G_I = G[jnp.ix_(I, I)]
+        Phit_y_I = Phit_y[I]
+        # Solve least squares over the selected K indices
+        x_I = _solve_gram(G_I, Phit_y_I)
+        # Compute residual norm squared without forming the residual
+        r_norm_sqr = _gram_res_norm_sqr(Phi, y, y_norm_sqr, I, x_I,
+            G_I, Phit_y_I)
+        return HTPState(x_I=x_I, I=I, r=None, r_norm_sqr=r_norm_sqr, 
+            iterations=state.iterations+1,
+            I_prev=I_prev)
+
+    def cond(state):
+        # limit on residual norm 
+        a = state.r_norm_sqr > max_r_norm_sqr
+        # limit on number of iterations
+        b = state.iterations < max_iters
+        c = jnp.logical_and(a, b)
+        # checking if support is still changing
+        d = ~jnp.array_equal(state.I, state.I_prev)
+        # consider support change only after some iterations
+        d = jnp.logical_or(state.iterations < min_iters, d)
+        c = jnp.logical_and(c,d)
+        # overall condition
+        return c
+
+    state = _iterate(cond, iteration, init(), max_iters)
+    # residual is computed only once at the end
+    r = y - Phi[:, state.I] @ state.x_I
+    return RecoverySolution(x_I=state.x_I, I=state.I, r=r, r_norm_sqr=r.T @ r,
+        iterations=state.iterations, length=Phi.shape[1])
+
+
+precomputed_solve_jit = jit(precomputed_solve, static_argnums=(2,),
+    static_argnames=("normalized", "step_size", "max_iters", "res_norm_rtol"))
+
+
+def matrix_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None, res_norm_rtol=1e-4,
+    dtype=None):
     """Solves the sparse recovery problem :math:`y = \\Phi x + e` using Hard Thresholding Pursuit for matrices
+
+    The residual is correlated with Phi directly in every iteration.
+    To share the Gram matrix of Phi across many signals, see
+    :func:`precomputed_solve` and :func:`matrix_solve_multi`.
+
+    If ``dtype`` is given, Phi is cast to it before solving (with y and the
+    least squares solves in at least single precision). Otherwise, if Phi
+    is a small NumPy matrix, the problem is solved on the host by
+    :func:`matrix_solve_np`.
     """
+    if dtype is None and isinstance(Phi, np.ndarray) and Phi.shape[1] <= HOST_MAX_N:
+        return matrix_solve_np(Phi, y, K, normalized=normalized,
+            step_size=step_size, max_iters=max_iters, res_norm_rtol=res_norm_rtol)
+    if dtype is not None:
+        Phi = Phi.astype(dtype)
+        y = y.astype(jnp.promote_types(dtype, jnp.float32))
     ## Initialize some constants for the algorithm
     M, N = Phi.shape
 
@@ -38,7 +164,7 @@ def matrix_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None, re
     max_r_norm_sqr = y_norm_sqr * (res_norm_rtol ** 2)
 
     if not normalized and step_size is None:
-        step_size = 0.98 / crdict.upper_frame_bound(Phi)
+        step_size = 0.98 / crdict.upper_frame_bound(Phi.astype(y.dtype))
 
     if max_iters is None:
         max_iters = M
@@ -47,9 +173,8 @@ def matrix_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None, re
 
     def compute_step_size(h, I):
         h_I = h[I]
-        Phi_I = Phi[:, I]
         # Step size calculation
-        Ah = Phi_I @ h_I
+        Ah = Phi[:, I] @ h_I
         mu = h_I.T @ h_I / (Ah.T @ Ah)
         return mu
 
@@ -58,9 +183,7 @@ def matrix_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None, re
 
     def init():
         # Data for the previous approximation [r = y, x = 0]
-        I_prev = jnp.arange(0, K)
-        x_I_prev = jnp.zeros(K)
-        r_norm_sqr_prev = y_norm_sqr
+        I_prev = jnp.arange(0, K, dtype=jnp.int32)
         # Assume previous estimate to be zero and conduct first iteration
         # compute the correlations of atoms with signal y
         h = Phi.T @ y
@@ -69,20 +192,16 @@ def matrix_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None, re
         x = mu * h
         # threshold
         I, x_I = hard_threshold(x, K)
-        # Form the subdictionary of corresponding atoms
-        Phi_I = Phi[:, I]
         # Compute new residual
-        r = y - Phi_I @ x_I
+        r = y - Phi[:, I] @ x_I
         # Compute residual norm squared
         r_norm_sqr = r.T @ r
         return HTPState(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, 
             iterations=1,
-            I_prev=I_prev, x_I_prev=x_I_prev, r_norm_sqr_prev=r_norm_sqr_prev)
+            I_prev=I_prev)
 
     def iteration(state):
         I_prev = state.I
-        x_I_prev = state.x_I
-        r_norm_sqr_prev = state.r_norm_sqr
         # compute the correlations of dictionary atoms with the residual
         h = Phi.T @ state.r
         # current approximation
@@ -96,16 +215,14 @@ def matrix_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None, re
         # Form the subdictionary of corresponding atoms
         Phi_I = Phi[:, I]
         # Solve least squares over the selected K indices
-        x_I, _, _, _ = jnp.linalg.lstsq(Phi_I, y)
+        x_I = solve_normal_eqs(Phi_I, y)
         # Compute new residual
-        y_hat = Phi_I @ x_I
-        r = y - y_hat
+        r = y - Phi_I @ x_I
         # Compute residual norm squared
         r_norm_sqr = r.T @ r
         return HTPState(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, 
             iterations=state.iterations+1,
-            I_prev=I_prev, x_I_prev=x_I_prev, r_norm_sqr_prev=r_norm_sqr_prev
-            )
+            I_prev=I_prev)
 
     def cond(state):
         # limit on residual norm 
@@ -114,20 +231,87 @@ def matrix_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None, re
         b = state.iterations < max_iters
         c = jnp.logical_and(a, b)
         # checking if support is still changing
-        d = jnp.any(jnp.not_equal(state.I, state.I_prev))
+        d = ~jnp.array_equal(state.I, state.I_prev)
         # consider support change only after some iterations
         d = jnp.logical_or(state.iterations < min_iters, d)
         c = jnp.logical_and(c,d)
         # overall condition
         return c
 
-    state = lax.while_loop(cond, iteration, init())
+    state = _iterate(cond, iteration, init(), max_iters)
     return RecoverySolution(x_I=state.x_I, I=state.I, r=state.r, r_norm_sqr=state.r_norm_sqr,
-        iterations=state.iterations, length=Phi.shape[1])
+        iterations=state.iterations, length=N)
 
 
 matrix_solve_jit  = jit(matrix_solve, static_argnums=(2), 
-    static_argnames=("normalized", "step_size", "max_iters", "res_norm_rtol"))
+    static_argnames=("normalized", "step_size", "max_iters", "res_norm_rtol", "dtype"))
+
+
+def matrix_solve_np(Phi, y, K, normalized=False, step_size=None, max_iters=None, res_norm_rtol=1e-4):
+    """Solves the sparse recovery problem :math:`y = \\Phi x + e` using Hard Thresholding Pursuit on the host
+
+    A NumPy version of :func:`matrix_solve` for small problems where
+    the per-operation JAX dispatch costs more than the arithmetic.
+    """
+    Phi = np.asarray(Phi)
+    y = np.asarray(y)
+    M, N = Phi.shape
+    # squared norm of the signal
+    y_norm_sqr = y @ y
+    max_r_norm_sqr = y_norm_sqr * (res_norm_rtol ** 2)
+    if not normalized and step_size is None:
+        step_size = 0.98 / np.linalg.norm(Phi, 2)
+    if max_iters is None:
+        max_iters = M
+    min_iters = min(3*K, 20)
+
+    def get_step_size(h, I):
+        if not normalized:
+            return step_size
+        h_I = h[I]
+        Phi_h_I = Phi[:, I] @ h_I
+        return (h_I @ h_I) / (Phi_h_I @ Phi_h_I)
+
+    # first iteration from a zero estimate
+    I_prev = np.arange(K)
+    h = Phi.T @ y
+    x = get_step_size(h, I_prev) * h
+    I = _np_largest_indices(x, K)
+    x_I = x[I]
+    r = y - Phi[:, I] @ x_I
+    r_norm_sqr = r @ r
+    iterations = 1
+    while (r_norm_sqr > max_r_norm_sqr and iterations < max_iters
+        and (iterations < min_iters or not np.array_equal(I, I_prev))):
+        I_prev = I
+        # gradient step from the current approximation
+        h = Phi.T @ r
+        x = get_step_size(h, I) * h
+        x[I] += x_I
+        # threshold and solve least squares over the new support
+        I = np.sort(_np_largest_indices(x, K))
+        Phi_I = Phi[:, I]
+        x_I = _np_solve_normal_eqs(Phi_I, y)
+        r = y - Phi_I @ x_I
+        r_norm_sqr = r @ r
+        iterations += 1
+    return RecoverySolution(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr,
+        iterations=iterations, length=N)
+
+
+def matrix_solve_multi(Phi, Y, K, normalized=False, step_size=None,
+    max_iters=None, res_norm_rtol=1e-4, dtype=None):
+    """Solves the MMV recovery problem :math:`Y = \\Phi X + E` using Hard Thresholding Pursuit
+
+    Extends :py:func:`cr.sparse.pursuit.htp.precomputed_solve` to each column of Y
+    using :py:func:`jax.vmap`. The Gram matrix of Phi is computed once for all columns.
+    """
+    solve = partial(precomputed_solve, precompute(Phi, dtype), K=K, normalized=normalized,
+        step_size=step_size, max_iters=max_iters, res_norm_rtol=res_norm_rtol)
+    return vmap(solve, 1, 0)(Y)
+
+matrix_solve_multi = jit(matrix_solve_multi, static_argnums=(2,),
+    static_argnames=("normalized", "step_size", "max_iters", "res_norm_rtol", "dtype"))
 
 
 
@@ -165,9 +349,7 @@ def operator_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None,
 
     def init():
         # Data for the previous approximation [r = y, x = 0]
-        I_prev = jnp.arange(0, K)
-        x_I_prev = jnp.zeros(K)
-        r_norm_sqr_prev = y_norm_sqr
+        I_prev = jnp.arange(0, K, dtype=jnp.int32)
         # Assume previous estimate to be zero and conduct first iteration
         # compute the correlations of atoms with signal y
         h = trans(y)
@@ -184,12 +366,10 @@ def operator_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None,
         r_norm_sqr = r.T @ r
         return HTPState(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, 
             iterations=1,
-            I_prev=I_prev, x_I_prev=x_I_prev, r_norm_sqr_prev=r_norm_sqr_prev)
+            I_prev=I_prev)
 
     def iteration(state):
         I_prev = state.I
-        x_I_prev = state.x_I
-        r_norm_sqr_prev = state.r_norm_sqr
         # compute the correlations of dictionary atoms with the residual
         h = trans(state.r)
         # current approximation
@@ -203,7 +383,7 @@ def operator_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None,
         # Form the subdictionary of corresponding atoms
         Phi_I = Phi.columns(I)
         # Solve least squares over the selected K indices
-        x_I, r_I_norms, rank_I, s_I = jnp.linalg.lstsq(Phi_I, y)
+        x_I = solve_normal_eqs(Phi_I, y)
         # Compute new residual
         y_hat = Phi_I @ x_I
         r = y - y_hat
@@ -211,8 +391,7 @@ def operator_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None,
         r_norm_sqr = r.T @ r
         return HTPState(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, 
             iterations=state.iterations+1,
-            I_prev=I_prev, x_I_prev=x_I_prev, r_norm_sqr_prev=r_norm_sqr_prev
-            )
+            I_prev=I_prev)
 
     def cond(state):
         # limit on residual norm 
@@ -221,14 +400,14 @@ def operator_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None,
         b = state.iterations < max_iters
         c = jnp.logical_and(a, b)
         # checking if support is still changing
-        d = jnp.any(jnp.not_equal(state.I, state.I_prev))
+        d = ~jnp.array_equal(state.I, state.I_prev)
         # consider support change only after some iterations
         d = jnp.logical_or(state.iterations < min_iters, d)
         c = jnp.logical_and(c,d)
         # overall condition
         return c
 
-    state = lax.while_loop(cond, iteration, init())
+    state = _iterate(cond, iteration, init(), max_iters)
     return RecoverySolution(x_I=state.x_I, I=state.I, r=state.r, r_norm_sqr=state.r_norm_sqr,
         iterations=state.iterations, length=Phi.shape[1])
 
@@ -17,9 +17,9 @@ from jax import vmap, jit, lax
 
 
 from .defs import RecoverySolution, IHTState
+from .util import hard_threshold
 
-from cr.nimble.dsp import (
-    hard_threshold, build_signal_from_indices_and_values)
+from cr.nimble.dsp import build_signal_from_indices_and_values
 import cr.sparse.dict as crdict
 import cr.sparse.lop as lop
 
@@ -55,9 +55,7 @@ def matrix_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None, re
 
     def init():
         # Data for the previous approximation [r = y, x = 0]
-        I_prev = jnp.arange(0, K)
-        x_I_prev = jnp.zeros(K)
-        r_norm_sqr_prev = y_norm_sqr
+        I_prev = jnp.arange(0, K, dtype=jnp.int32)
         # Assume previous estimate to be zero and conduct first iteration
         # compute the correlations of atoms with signal y
         h = Phi.T @ y
@@ -74,12 +72,10 @@ def matrix_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None, re
         r_norm_sqr = r.T @ r
         return IHTState(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, 
             iterations=1,
-            I_prev=I_prev, x_I_prev=x_I_prev, r_norm_sqr_prev=r_norm_sqr_prev)
+            I_prev=I_prev)
 
     def body(state):
         I_prev = state.I
-        x_I_prev = state.x_I
-        r_norm_sqr_prev = state.r_norm_sqr
         # compute the correlations of dictionary atoms with the residual
         h = Phi.T @ state.r
         # current approximation
@@ -98,8 +94,7 @@ def matrix_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None, re
         r_norm_sqr = r.T @ r
         return IHTState(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, 
             iterations=state.iterations+1,
-            I_prev=I_prev, x_I_prev=x_I_prev, r_norm_sqr_prev=r_norm_sqr_prev
-            )
+            I_prev=I_prev)
 
     def cond(state):
         # limit on residual norm 
@@ -150,9 +145,7 @@ def operator_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None,
 
     def init():
         # Data for the previous approximation [r = y, x = 0]
-        I_prev = jnp.arange(0, K)
-        x_I_prev = jnp.zeros(K)
-        r_norm_sqr_prev = y_norm_sqr
+        I_prev = jnp.arange(0, K, dtype=jnp.int32)
         # Assume previous estimate to be zero and conduct first iteration
         # compute the correlations of atoms with signal y
         h = trans(y)
@@ -169,12 +162,10 @@ def operator_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None,
         r_norm_sqr = r.T @ r
         return IHTState(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, 
             iterations=1,
-            I_prev=I_prev, x_I_prev=x_I_prev, r_norm_sqr_prev=r_norm_sqr_prev)
+            I_prev=I_prev)
 
     def body(state):
         I_prev = state.I
-        x_I_prev = state.x_I
-        r_norm_sqr_prev = state.r_norm_sqr
         # compute the correlations of dictionary atoms with the residual
         h = trans(state.r)
         # current approximation
@@ -193,8 +184,7 @@ def operator_solve(Phi, y, K, normalized=False, step_size=None, max_iters=None,
         r_norm_sqr = r.T @ r
         return IHTState(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, 
             iterations=state.iterations+1,
-            I_prev=I_prev, x_I_prev=x_I_prev, r_norm_sqr_prev=r_norm_sqr_prev
-            )
+            I_prev=I_prev)
 
     def cond(state):
         # limit on residual norm 
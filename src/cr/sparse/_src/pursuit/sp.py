@@ -13,6 +13,9 @@
 # limitations under the License.
 
 
+from functools import partial
+
+import numpy as np
 import jax
 import jax.numpy as jnp
 from jax import vmap, jit, lax
@@ -20,16 +23,114 @@ from jax import vmap, jit, lax
 
 from .defs import RecoverySolution, SPState
 
-from cr.nimble.dsp import largest_indices
+from .util import (precompute, HOST_MAX_N,
+    largest_indices, _largest_indices_excluding, solve_normal_eqs,
+    _solve_gram, _gram_res_norm_sqr, _merge_indices, _iterate,
+    _np_largest_indices, _np_largest_indices_excluding, _np_solve_normal_eqs)
 import cr.sparse as crs
 
 
 
-def matrix_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4):
+def precomputed_solve(pre, y, K, max_iters=None, res_norm_rtol=1e-4):
+    r"""Solves the sparse recovery problem :math:`y = \Phi x + e` using Subspace Pursuit with a precomputed Gram matrix
+
+    Args:
+        pre (GramData): Phi and its Gram matrix from :func:`cr.sparse.pursuit.precompute`
+    """
+    Phi, G = pre.Phi, pre.G
+    # work in the precision of the Gram matrix
+    y = y.astype(G.dtype)
+    ## Initialize some constants for the algorithm
+    M, N = Phi.shape
+    # buffer for the combined 2K index set
+    I_2k_buf = jnp.zeros(2*K, dtype=jnp.int32)
+    # squared norm of the signal
+    y_norm_sqr = y.T @ y
+
+    max_r_norm_sqr = y_norm_sqr * (res_norm_rtol ** 2) 
+
+    # correlations with y are shared by all iterations
+    Phit_y = Phi.T @ y
+
+    if max_iters is None:
+        max_iters = M 
+
+    def init():
+        # compute the correlations of atoms with signal y
+        h = Phit_y
+        # Pick largest K indices [this is first iteration]
+        I = largest_indices(h, K)
+        G_I = G[jnp.ix_(I, I)]
+        Phit_y_I = Phit_y[I]
+        # Solve least squares over the selected indices
+        x_I = _solve_gram(G_I, Phit_y_I)
+        # Compute residual norm squared without forming the residual
+        r_norm_sqr = _gram_res_norm_sqr(Phi, y, y_norm_sqr, I, x_I,
+            G_I, Phit_y_I)
+        # Assemble the algorithm state at the end of first iteration
+        return RecoverySolution(x_I=x_I, I=I, r=None, r_norm_sqr=r_norm_sqr, iterations=1, length=Phi.shape[1])
+
+    def body(state):
+        # compute the correlations of dictionary atoms with the residual
+        h = Phit_y - G[:, state.I] @ state.x_I
+        # Pick largest K indices ignoring the previously selected atoms
+        I_new = _largest_indices_excluding(h, state.I, K)
+        # Combine with previous K indices to form a set of 2K indices
+        I_2k = _merge_indices(I_2k_buf, state.I, I_new)
+        # Solve least squares over the selected 2K indices
+        x_p = _solve_gram(G[jnp.ix_(I_2k, I_2k)], Phit_y[I_2k])
+        # pick the K largest indices
+        Ia = largest_indices(x_p, K)
+        # Identify indices for corresponding atoms
+        I = I_2k[Ia]
+        G_I = G[jnp.ix_(I, I)]
+        Phit_y_I = Phit_y[I]
+        # Solve least squares over the selected K indices
+        x_I = _solve_gram(G_I, Phit_y_I)
+        # Compute residual norm squared without forming the residual
+        r_norm_sqr = _gram_res_norm_sqr(Phi, y, y_norm_sqr, I, x_I,
+            G_I, Phit_y_I)
+        return RecoverySolution(x_I=x_I, I=I, r=None, r_norm_sqr=r_norm_sqr, iterations=state.iterations+1, length=Phi.shape[1])
+
+    def cond(state):
+        # limit on residual norm 
+        a = state.r_norm_sqr > max_r_norm_sqr
+        # limit on number of iterations
+        b = state.iterations < max_iters
+        c = jnp.logical_and(a, b)
+        return c
+
+    state = _iterate(cond, body, init(), max_iters)
+    # residual is computed only once at the end
+    r = y - Phi[:, state.I] @ state.x_I
+    return RecoverySolution(x_I=state.x_I, I=state.I, r=r, r_norm_sqr=r.T @ r,
+        iterations=state.iterations, length=N)
+
+precomputed_solve_jit = jit(precomputed_solve, static_argnums=(2,),
+    static_argnames=("max_iters", "res_norm_rtol"))
+
+
+def matrix_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4, dtype=None):
     r"""Solves the sparse recovery problem :math:`y = \Phi x + e` using Subspace Pursuit for matrices
+
+    The residual is correlated with Phi directly in every iteration.
+    To share the Gram matrix of Phi across many signals, see
+    :func:`precomputed_solve` and :func:`matrix_solve_multi`.
+
+    If ``dtype`` is given, Phi is cast to it before solving (with y and the
+    least squares solves in at least single precision). Otherwise, if Phi
+    is a small NumPy matrix, the problem is solved on the host by
+    :func:`matrix_solve_np`.
     """
+    if dtype is None and isinstance(Phi, np.ndarray) and Phi.shape[1] <= HOST_MAX_N:
+        return matrix_solve_np(Phi, y, K, max_iters=max_iters, res_norm_rtol=res_norm_rtol)
+    if dtype is not None:
+        Phi = Phi.astype(dtype)
+        y = y.astype(jnp.promote_types(dtype, jnp.float32))
     ## Initialize some constants for the algorithm
     M, N = Phi.shape
+    # buffer for the combined 2K index set
+    I_2k_buf = jnp.zeros(2*K, dtype=jnp.int32)
     # squared norm of the signal
     y_norm_sqr = y.T @ y
 
@@ -46,43 +147,38 @@ def matrix_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4):
         # Pick corresponding atoms to form the K wide subdictionary
         Phi_I = Phi[:, I]
         # Solve least squares over the selected indices
-        x_I, r_I_norms, rank_I, s_I = jnp.linalg.lstsq(Phi_I, y)
+        x_I = solve_normal_eqs(Phi_I, y)
         # Compute new residual
         r = y - Phi_I @ x_I
         # Compute residual norm squared
         r_norm_sqr = r.T @ r
         # Assemble the algorithm state at the end of first iteration
-        return RecoverySolution(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, iterations=1, length=Phi.shape[1])
+        return RecoverySolution(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, iterations=1, length=N)
 
     def body(state):
         # compute the correlations of dictionary atoms with the residual
         h = Phi.T @ state.r
-        # Ignore the previously selected atoms
-        h = h.at[state.I].set(0)
-        # Pick largest K indices
-        I_new = largest_indices(h, K)
+        # Pick largest K indices ignoring the previously selected atoms
+        I_new = _largest_indices_excluding(h, state.I, K)
         # Combine with previous K indices to form a set of 2K indices
-        I_2k = jnp.hstack((state.I, I_new))
+        I_2k = _merge_indices(I_2k_buf, state.I, I_new)
         # Pick corresponding atoms to form the 2K wide subdictionary
         Phi_2I = Phi[:, I_2k]
         # Solve least squares over the selected 2K indices
-        x_p, r_p_norms, rank_p, s_p = jnp.linalg.lstsq(Phi_2I, y)
+        x_p = solve_normal_eqs(Phi_2I, y)
         # pick the K largest indices
         Ia = largest_indices(x_p, K)
         # Identify indices for corresponding atoms
         I = I_2k[Ia]
-        # TODO consider how we can exploit the guess for x_I
-        # # Corresponding non-zero entries in the sparse approximation
-        # x_I = x_p[Ia]
-        # Form the subdictionary of corresponding atoms
-        Phi_I = Phi[:, I]
+        # The corresponding atoms are already in the 2K wide subdictionary
+        Phi_I = Phi_2I[:, Ia]
         # Solve least squares over the selected K indices
-        x_I, r_I_norms, rank_I, s_I = jnp.linalg.lstsq(Phi_I, y)
+        x_I = solve_normal_eqs(Phi_I, y)
         # Compute new residual
         r = y - Phi_I @ x_I
         # Compute residual norm squared
         r_norm_sqr = r.T @ r
-        return RecoverySolution(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, iterations=state.iterations+1, length=Phi.shape[1])
+        return RecoverySolution(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, iterations=state.iterations+1, length=N)
 
     def cond(state):
         # limit on residual norm 
@@ -92,10 +188,63 @@ def matrix_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4):
         c = jnp.logical_and(a, b)
         return c
 
-    state = lax.while_loop(cond, body, init())
-    return state
+    return _iterate(cond, body, init(), max_iters)
+
 
-matrix_solve_jit = jit(matrix_solve, static_argnums=(2), static_argnames=("max_iters", "res_norm_rtol"))
+matrix_solve_jit = jit(matrix_solve, static_argnums=(2,),
+    static_argnames=("max_iters", "res_norm_rtol", "dtype"))
+
+
+def matrix_solve_multi(Phi, Y, K, max_iters=None, res_norm_rtol=1e-4, dtype=None):
+    """Solves the MMV recovery problem :math:`Y = \\Phi X + E` using Subspace Pursuit
+
+    Extends :py:func:`cr.sparse.pursuit.sp.precomputed_solve` to each column of Y
+    using :py:func:`jax.vmap`. The Gram matrix of Phi is computed once for all columns.
+    """
+    solve = partial(precomputed_solve, precompute(Phi, dtype), K=K, max_iters=max_iters,
+        res_norm_rtol=res_norm_rtol)
+    return vmap(solve, 1, 0)(Y)
+
+matrix_solve_multi = jit(matrix_solve_multi, static_argnums=(2,),
+    static_argnames=("max_iters", "res_norm_rtol", "dtype"))
+
+
+def matrix_solve_np(Phi, y, K, max_iters=None, res_norm_rtol=1e-4):
+    r"""Solves the sparse recovery problem :math:`y = \Phi x + e` using Subspace Pursuit on the host
+
+    A NumPy version of :func:`matrix_solve` for small problems where
+    the per-operation JAX dispatch costs more than the arithmetic.
+    """
+    Phi = np.asarray(Phi)
+    y = np.asarray(y)
+    M, N = Phi.shape
+    # squared norm of the signal
+    y_norm_sqr = y @ y
+    max_r_norm_sqr = y_norm_sqr * (res_norm_rtol ** 2)
+    if max_iters is None:
+        max_iters = M
+
+    # first iteration
+    I = _np_largest_indices(Phi.T @ y, K)
+    Phi_I = Phi[:, I]
+    x_I = _np_solve_normal_eqs(Phi_I, y)
+    r = y - Phi_I @ x_I
+    r_norm_sqr = r @ r
+    iterations = 1
+    while r_norm_sqr > max_r_norm_sqr and iterations < max_iters:
+        # correlations with the residual ignoring the previously selected atoms
+        h = Phi.T @ r
+        I_2k = np.concatenate((I, _np_largest_indices_excluding(h, I, K)))
+        # least squares over the 2K candidates and pruning to K atoms
+        x_p = _np_solve_normal_eqs(Phi[:, I_2k], y)
+        I = I_2k[_np_largest_indices(x_p, K)]
+        Phi_I = Phi[:, I]
+        x_I = _np_solve_normal_eqs(Phi_I, y)
+        r = y - Phi_I @ x_I
+        r_norm_sqr = r @ r
+        iterations += 1
+    return RecoverySolution(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr,
+        iterations=iterations, length=N)
 
 
 def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
@@ -114,6 +263,8 @@ def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
     trans = Phi.trans
     ## Initialize some constants for the algorithm
     M = y.shape[0]
+    # buffer for the combined 2K index set
+    I_2k_buf = jnp.zeros(2*K, dtype=jnp.int32)
     # squared norm of the signal
     y_norm_sqr = jnp.abs(jnp.vdot(y, y))
     y_norm = jnp.sqrt(y_norm_sqr)
@@ -121,7 +272,6 @@ def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
     scale = 1.0 / y_norm
     y = scale * y
 
-    dtype = jnp.float64 if Phi.real else jnp.complex128
     max_r_norm_sqr = (res_norm_rtol ** 2) 
 
     if max_iters is None:
@@ -131,9 +281,7 @@ def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
 
     def init():
         # Data for the previous approximation [r = y, x = 0]
-        I_prev = jnp.arange(0, K)
-        x_I_prev = jnp.zeros(K, dtype=dtype)
-        r_norm_sqr_prev = 1.
+        I_prev = jnp.arange(0, K, dtype=jnp.int32)
         # compute the correlations of atoms with signal y
         h = trans(y)
         # Pick largest K indices [this is first iteration]
@@ -141,7 +289,7 @@ def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
         # Pick corresponding atoms to form the K wide subdictionary
         Phi_I = Phi.columns(I)
         # Solve least squares over the selected indices
-        x_I, r_I_norms, rank_I, s_I = jnp.linalg.lstsq(Phi_I, y)
+        x_I = solve_normal_eqs(Phi_I, y)
         # Compute new residual
         r = y - Phi_I @ x_I
         # Compute residual norm squared
@@ -149,24 +297,20 @@ def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
         # Assemble the algorithm state at the end of first iteration
         return SPState(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, 
             iterations=1,
-            I_prev=I_prev, x_I_prev=x_I_prev, r_norm_sqr_prev=r_norm_sqr_prev)
+            I_prev=I_prev)
 
     def body(state):
         I_prev = state.I
-        x_I_prev = state.x_I
-        r_norm_sqr_prev = state.r_norm_sqr
         # compute the correlations of dictionary atoms with the residual
         h = trans(state.r)
-        # Ignore the previously selected atoms
-        h = h.at[state.I].set(0)
-        # Pick largest K indices
-        I_new = largest_indices(h, K)
+        # Pick largest K indices ignoring the previously selected atoms
+        I_new = _largest_indices_excluding(h, state.I, K)
         # Combine with previous K indices to form a set of 2K indices
-        I_2k = jnp.hstack((state.I, I_new))
+        I_2k = _merge_indices(I_2k_buf, state.I, I_new)
         # Pick corresponding atoms to form the 2K wide subdictionary
         Phi_2I = Phi.columns(I_2k)
         # Solve least squares over the selected 2K indices
-        x_p, r_p_norms, rank_p, s_p = jnp.linalg.lstsq(Phi_2I, y)
+        x_p = solve_normal_eqs(Phi_2I, y)
         # pick the K largest indices
         Ia = largest_indices(x_p, K)
         # Identify indices for corresponding atoms
@@ -174,18 +318,17 @@ def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
         # TODO consider how we can exploit the guess for x_I
         # # Corresponding non-zero entries in the sparse approximation
         # x_I = x_p[Ia]
-        # Form the subdictionary of corresponding atoms
-        Phi_I = Phi.columns(I)
+        # The corresponding atoms are already in the 2K wide subdictionary
+        Phi_I = Phi_2I[:, Ia]
         # Solve least squares over the selected K indices
-        x_I, r_I_norms, rank_I, s_I = jnp.linalg.lstsq(Phi_I, y)
+        x_I = solve_normal_eqs(Phi_I, y)
         # Compute new residual
         r = y - Phi_I @ x_I
         # Compute residual norm squared
         r_norm_sqr = jnp.abs(jnp.vdot(r, r))
         return SPState(x_I=x_I, I=I, r=r, r_norm_sqr=r_norm_sqr, 
             iterations=state.iterations+1,
-            I_prev=I_prev, x_I_prev=x_I_prev, r_norm_sqr_prev=r_norm_sqr_prev
-            )
+            I_prev=I_prev)
 
     def cond(state):
         # limit on residual norm 
@@ -201,7 +344,7 @@ def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
         jax.debug.callback(tracker, state, more=c)
         return c
 
-    state = lax.while_loop(cond, body, init())
+    state = _iterate(cond, body, init(), max_iters)
     # scale back the result
     x_I = y_norm * state.x_I
     r = y_norm * state.r
@@ -209,6 +352,7 @@ def operator_solve(Phi, y, K, max_iters=None, res_norm_rtol=1e-4,
     return RecoverySolution(x_I=x_I, I=state.I, r=r, r_norm_sqr=r_norm_sqr,
         iterations=state.iterations, length=Phi.shape[1])
 
-operator_solve_jit = jit(operator_solve, static_argnames=("Phi", "K", "tracker"))
+operator_solve_jit = jit(operator_solve, static_argnums=(0, 2),
+    static_argnames=("max_iters", "res_norm_rtol", "tracker"))
 
 solve = operator_solve_jit
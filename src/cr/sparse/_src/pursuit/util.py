@@ -12,19 +12,65 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import numpy as np
+import scipy.linalg
 import jax.numpy as jnp
+from jax import lax
+from jax.scipy.linalg import cho_factor, cho_solve
 
+from cr.nimble import hermitian
+
+from .defs import GramData
 from cr.nimble import solve_Lx_b, solve_LTx_b, solve_Ux_b, solve_UTx_b
 
 
+# static iteration budgets up to this size are run as an unrolled fori_loop
+UNROLL_MAX_ITERS = 8
+
+HOST_MAX_N = 2048
+"Largest number of columns of a NumPy matrix for which the host solvers are used"
+
 def abs_max_idx(h):
     """Returns the index of entry with highest magnitude
     """
     return jnp.argmax(jnp.abs(h))
 
 def largest_indices(h, K):
-    indices = jnp.argsort(jnp.abs(h))
-    return indices[:-K-1:-1]
+    """Returns the (int32) indices of K largest entries in h by magnitude (in descending order)
+    """
+    # partial selection instead of a full sort of h
+    _, indices = lax.top_k(jnp.abs(h), K)
+    return indices
+
+
+def _largest_indices_excluding(h, I, K):
+    """Returns the (int32) indices of K largest entries in h by magnitude, skipping the entries in I
+    """
+    # zeroing h[I] is not enough: when the rest of h ties at zero,
+    # top_k may pick entries of I again and duplicate the merged support
+    _, indices = lax.top_k(jnp.abs(h).at[I].set(-jnp.inf), K)
+    return indices
+
+
+def _merge_indices(buf, I, I_new):
+    """Writes I followed by I_new into a preallocated index buffer
+    """
+    buf = lax.dynamic_update_slice(buf, I.astype(buf.dtype), (0,))
+    return lax.dynamic_update_slice(buf, I_new.astype(buf.dtype), (I.shape[0],))
+
+
+def hard_threshold(x, K):
+    """Returns the indices and values of K largest entries in x by magnitude
+    """
+    I = largest_indices(x, K)
+    return I, x[I]
+
+
+def hard_threshold_sorted(x, K):
+    """Returns the indices (in ascending order) and values of K largest entries in x by magnitude
+    """
+    I = jnp.sort(largest_indices(x, K))
+    return I, x[I]
 
 
 def gram_chol_update(L, v):
@@ -38,3 +84,130 @@ def gram_chol_update(L, v):
     L1 = jnp.hstack((w.T, s))
     L = jnp.vstack((L0, L1))
     return L
+
+
+def precompute(Phi, dtype=None):
+    """Computes the Gram matrix of Phi once for repeated greedy recoveries
+
+    The result can be passed to the ``precomputed_solve`` functions of
+    CoSaMP, SP and HTP in place of Phi. It also carries the upper frame
+    bound of Phi used for the default HTP step size.
+
+    If ``dtype`` is given (e.g. ``jnp.float32`` or ``jnp.bfloat16``), Phi is
+    cast to it first. The Gram matrix is accumulated in at least single
+    precision and the solvers work in its precision.
+    """
+    if dtype is not None:
+        Phi = Phi.astype(dtype)
+    acc_dtype = jnp.promote_types(Phi.dtype, jnp.float32)
+    G = jnp.matmul(Phi.T, Phi, preferred_element_type=acc_dtype)
+    # the upper frame bound from the smaller of Phi Phi^T and Phi^T Phi,
+    # much cheaper than an SVD of Phi
+    M, N = Phi.shape
+    S = G if N <= M else jnp.matmul(Phi, Phi.T, preferred_element_type=acc_dtype)
+    upper_frame_bound = jnp.sqrt(jnp.linalg.eigvalsh(S)[-1])
+    return GramData(Phi=Phi, G=G, upper_frame_bound=upper_frame_bound)
+
+
+def solve_normal_eqs(Phi_I, y):
+    r"""Least squares solution of :math:`\Phi_I x = y` via the normal equations
+
+    The Gram matrix :math:`\Phi_I^H \Phi_I` is small (a few K wide) for
+    greedy pursuits, so a Cholesky solve is much cheaper than the QR
+    used by ``jnp.linalg.lstsq`` on a tall skinny :math:`\Phi_I`.
+    A tiny ridge proportional to the trace keeps the factorization
+    defined when the selected atoms are (nearly) dependent.
+    """
+    Phi_I_h = hermitian(Phi_I)
+    # low precision atoms are accumulated in at least single precision
+    acc_dtype = jnp.promote_types(Phi_I.dtype, jnp.float32)
+    G = jnp.matmul(Phi_I_h, Phi_I, preferred_element_type=acc_dtype)
+    return _solve_gram(G, Phi_I_h @ y)
+
+
+def _solve_gram(G, b):
+    """Solves :math:`G x = b` for a (sub-)Gram matrix :math:`G` by Cholesky
+    """
+    n = G.shape[0]
+    ridge = jnp.finfo(G.dtype).eps * jnp.real(jnp.trace(G)) / n
+    G = G + ridge * jnp.eye(n, dtype=G.dtype)
+    return cho_solve(cho_factor(G, lower=True), b)
+
+
+def _gram_res_norm_sqr(Phi, y, y_norm_sqr, I, x_I, G_I, Phit_y_I):
+    r"""Computes :math:`\| y - \Phi_I x_I \|_2^2` from the sub-Gram matrix
+
+    The residual is formed explicitly only when the K-dimensional estimate
+    is dominated by cancellation, i.e. close to convergence.
+    """
+    r_norm_sqr = y_norm_sqr - 2 * jnp.vdot(x_I, Phit_y_I) + jnp.vdot(x_I, G_I @ x_I)
+    r_norm_sqr = jnp.real(r_norm_sqr)
+    reliable = r_norm_sqr > 64 * jnp.finfo(r_norm_sqr.dtype).eps * y_norm_sqr
+
+    def exact(_):
+        r = y - Phi[:, I] @ x_I
+        return jnp.real(jnp.vdot(r, r)).astype(r_norm_sqr.dtype)
+
+    return lax.cond(reliable, lambda _: r_norm_sqr, exact, None)
+
+
+def _iterate(cond, body, state, max_iters):
+    """Runs ``body`` on the state while ``cond`` holds
+
+    The initial state already counts as the first iteration. Small static
+    budgets use a fixed-trip unrolled ``fori_loop`` in which a converged
+    state passes through unchanged. Otherwise this is a ``while_loop``.
+    """
+    if not isinstance(max_iters, int) or max_iters > UNROLL_MAX_ITERS:
+        return lax.while_loop(cond, body, state)
+    stop = lambda s: jnp.array(False)
+
+    def step(i, carry):
+        state, more = carry
+        # cond is not evaluated again once the iterations have stopped
+        more = lax.cond(more, cond, stop, state)
+        state = lax.cond(more, body, lambda s: s, state)
+        return state, more
+
+    n_steps = max_iters - 1
+    if n_steps > 0:
+        state, more = lax.fori_loop(0, n_steps, step, (state, jnp.array(True)),
+            unroll=n_steps)
+    else:
+        more = jnp.array(True)
+    # final check, as the while_loop would do after its last iteration
+    lax.cond(more, cond, stop, state)
+    return state
+
+
+############################################################################
+#  Host (NumPy) helpers for small problems
+############################################################################
+
+def _np_largest_indices(h, K):
+    """Host version of :func:`largest_indices`
+    """
+    return _np_top_k(np.abs(h), K)
+
+
+def _np_largest_indices_excluding(h, I, K):
+    """Host version of :func:`_largest_indices_excluding`
+    """
+    u = np.abs(h)
+    u[I] = -np.inf
+    return _np_top_k(u, K)
+
+
+def _np_top_k(u, K):
+    I = np.argpartition(-u, K-1)[:K]
+    return I[np.argsort(-u[I], kind='stable')]
+
+
+def _np_solve_normal_eqs(Phi_I, y):
+    """Host version of :func:`solve_normal_eqs`
+    """
+    G = Phi_I.T @ Phi_I
+    n = G.shape[0]
+    ridge = np.finfo(G.dtype).eps * np.trace(G) / n
+    G = G + ridge * np.eye(n, dtype=G.dtype)
+    return scipy.linalg.cho_solve(scipy.linalg.cho_factor(G, lower=True), Phi_I.T @ y)
@@ -119,6 +119,9 @@ from cr.sparse._src.lop.onb import (
     dirac_fourier_basis,
     cosine_basis,
     walsh_hadamard_basis,
+    dirac_hadamard_basis,
+    dirac_cosine_basis,
+    dirac_hadamard_cosine_basis,
 )
 
 # Fast Fourier Transform
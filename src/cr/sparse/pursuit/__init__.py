@@ -20,9 +20,12 @@ Sparse recovery algorithms
 from cr.sparse._src.pursuit.util import (
     abs_max_idx,
     gram_chol_update,
-    largest_indices
+    largest_indices,
+    solve_normal_eqs,
+    precompute,
 )
 
 from cr.sparse._src.pursuit.defs import (
-    RecoverySolution
+    RecoverySolution,
+    GramData,
 )
\ No newline at end of file
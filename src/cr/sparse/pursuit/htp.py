@@ -22,6 +22,10 @@ from cr.sparse._src.pursuit.htp import (
     solve,
     matrix_solve,
     matrix_solve_jit,
+    matrix_solve_np,
+    matrix_solve_multi,
+    precomputed_solve,
+    precomputed_solve_jit,
     operator_solve,
     operator_solve_jit
 )
@@ -14,6 +14,10 @@
 
 """
 Subspace Pursuit
+
+Use the ``*_jit`` variants in hot loops. ``K`` (and ``Phi`` for
+the operator version) must be static, so each new sparsity level
+triggers a fresh compilation.
 """
 
 # pylint: disable=W0611
@@ -23,6 +27,10 @@ from cr.sparse._src.pursuit.sp import (
     solve,
     matrix_solve,
     matrix_solve_jit,
+    matrix_solve_np,
+    matrix_solve_multi,
+    precomputed_solve,
+    precomputed_solve_jit,
     operator_solve,
     operator_solve_jit,
 
@@ -10,6 +10,7 @@ import cr.sparse.lop as lop
 import cr.sparse.data as crdata
 
 from cr.sparse.cvx import l1ls
+from cr.sparse.cvx import spgl1
 from cr.sparse.cvx.adm import yall1
 
 
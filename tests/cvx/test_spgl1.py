@@ -0,0 +1,87 @@
+from .cvx_setup import *
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+import cr.sparse._src.cvx.spgl1 as spgl1_src
+from cr.sparse._src.cvx.spgl1 import project_to_l1_ball, _project_to_l1_ball
+
+
+@pytest.mark.parametrize("x,q,expected", [
+    [[3., -1., 0.5], 2., [2., 0., 0.]],
+    [[1., 1., 1., 1.], 2., [.5, .5, .5, .5]],
+    [[1., 1., 1., 1.], 0., [0., 0., 0., 0.]],
+    [[0.1, -0.2], 1., [0.1, -0.2]],
+])
+def test_project_to_l1_ball(x, q, expected):
+    v = project_to_l1_ball(jnp.array(x), q)
+    assert_allclose(v, expected, atol=1e-6)
+    # the unconditional projection must agree
+    v = _project_to_l1_ball(jnp.array(x), q)
+    assert_allclose(v, expected, atol=1e-6)
+
+
+def test_project_to_l1_ball_random():
+    v = random.normal(keys[2], (500,))
+    q = 3.
+    w = project_to_l1_ball(v, q)
+    assert_allclose(jnp.sum(jnp.abs(w)), q, rtol=1e-5)
+    # second projection should not change it
+    assert_allclose(project_to_l1_ball(w, q), w, atol=1e-6)
+
+
+def test_solve_bp():
+    sol = spgl1.solve_bp_jit(Phi, y)
+    assert_allclose(sol.x, x, atol=1e-2)
+
+
+class _Unhashable:
+    """A matrix product that cannot be used as a static jit argument"""
+    __hash__ = None
+
+    def __init__(self, A):
+        self.A = A
+
+    def __call__(self, x):
+        return self.A @ x
+
+
+def test_solve_not_jit_safe():
+    A = lop.to_matrix(Phi)
+    T = lop.Operator(times=_Unhashable(A), trans=_Unhashable(A.T),
+        shape=A.shape, jit_safe=False)
+    tau = 0.8 * float(jnp.sum(jnp.abs(x)))
+    sol = spgl1.solve_lasso(T, y, tau)
+    assert_allclose(sol.x, spgl1.solve_lasso_jit(Phi, y, tau).x, atol=1e-4)
+    sol = spgl1.solve_bp(T, y)
+    assert_allclose(sol.x, x, atol=1e-2)
+
+
+def test_solve_lasso_np():
+    A = lop.to_matrix(Phi)
+    tau = 0.8 * float(jnp.sum(jnp.abs(x)))
+    sol_jax = spgl1.solve_lasso_jit(lop.matrix(A), y, tau)
+    sol_np = spgl1.solve_lasso(np.asarray(A), np.asarray(y), tau)
+    assert isinstance(sol_np.x, np.ndarray)
+    assert_allclose(sol_np.x, sol_jax.x, atol=1e-4)
+
+
+def test_solve_lasso_np_large(monkeypatch):
+    # NumPy matrices beyond the host limit go through the JAX solver
+    monkeypatch.setattr(spgl1_src, "HOST_MAX_N", N // 2)
+    A = lop.to_matrix(Phi)
+    tau = 0.8 * float(jnp.sum(jnp.abs(x)))
+    sol = spgl1.solve_lasso(np.asarray(A), np.asarray(y), tau)
+    assert isinstance(sol.x, jax.Array)
+    assert_allclose(sol.x, spgl1.solve_lasso_jit(Phi, y, tau).x, atol=1e-4)
+
+
+def test_solve_lasso_np_tracker():
+    A = np.asarray(lop.to_matrix(Phi))
+    tau = 0.8 * float(jnp.sum(jnp.abs(x)))
+    calls = []
+    tracker = lambda state, more=False: calls.append((state.iterations, more))
+    sol = spgl1.solve_lasso(A, np.asarray(y), tau, tracker=tracker)
+    assert len(calls) == sol.iterations
+    assert calls[-1] == (sol.iterations, False)
+    assert all(more for _, more in calls[:-1])
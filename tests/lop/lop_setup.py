@@ -9,6 +9,7 @@ from jax import random, lax
 import cr.nimble as cnb
 import cr.sparse as crs
 from cr.sparse import lop
+import cr.sparse.dict as crdict
 
 rtol = 1e-8 if jax.config.jax_enable_x64 else 1e-6
 atol = 1e-7 if jax.config.jax_enable_x64 else 1e-5
@@ -63,3 +63,45 @@ def test_matrix_4():
     assert_allclose(T.times(X), (X @ A.T), atol=atol)
     assert_allclose(T.trans(Y), (Y @ jnp.conjugate(A)), atol=atol)
 
+
+
+@pytest.mark.parametrize("chunk", [1, 3, 7, 20])
+def test_to_matrix_chunked(chunk):
+    m, n = 10, 20
+    A = random.normal(cnb.KEYS[0], (m,n))
+    T = lop.matrix(A)
+    assert_allclose(lop.to_matrix(T, chunk=chunk), A, atol=atol, rtol=rtol)
+    assert_allclose(lop.to_adjoint_matrix(T, chunk=chunk), A.T, atol=atol, rtol=rtol)
+
+
+class _Unhashable:
+    """A matrix product that cannot be used as a static jit argument"""
+    __hash__ = None
+
+    def __init__(self, A):
+        self.A = A
+
+    def __call__(self, x):
+        return self.A @ x
+
+
+def test_to_matrix_not_jit_safe():
+    m, n = 10, 20
+    A = random.normal(cnb.KEYS[0], (m,n))
+    T = lop.Operator(times=_Unhashable(A), trans=_Unhashable(A.T), shape=(m,n),
+        jit_safe=False)
+    assert_allclose(lop.to_matrix(T, chunk=7), A, atol=atol, rtol=rtol)
+    assert_allclose(lop.to_adjoint_matrix(T, chunk=7), A.T, atol=atol, rtol=rtol)
+
+
+def test_to_matrix_chunked_nd():
+    # multi-dimensional operators reuse one compilation across calls
+    from cr.sparse._src.lop.util import _apply_to_identity_jit
+    T = lop.jit(lop.dwt2D((8,8)))
+    expected = lop.to_matrix(T)
+    assert_allclose(lop.to_matrix(T, chunk=16), expected, atol=atol, rtol=rtol)
+    assert_allclose(lop.to_adjoint_matrix(T, chunk=16), expected.T, atol=atol, rtol=rtol)
+    size = _apply_to_identity_jit._cache_size()
+    lop.to_matrix(T, chunk=16)
+    lop.to_adjoint_matrix(T, chunk=16)
+    assert _apply_to_identity_jit._cache_size() == size
@@ -41,3 +41,16 @@ def test_wh_basis():
     assert cnb.has_unitary_columns(F)
     assert lop.dot_test_real(keys[0], T)
 
+
+
+@pytest.mark.parametrize("name", [
+    "dirac_hadamard_basis",
+    "dirac_cosine_basis",
+    "dirac_hadamard_cosine_basis",
+])
+def test_dirac_plus_bases(name):
+    n = 16
+    T = lop.jit(getattr(lop, name)(n))
+    A = getattr(crdict, name)(n)
+    assert_allclose(lop.to_matrix(T), A, atol=atol, rtol=rtol)
+    assert lop.dot_test_real(keys[0], T)
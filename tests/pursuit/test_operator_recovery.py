@@ -56,6 +56,14 @@ def test_sp():
     assert rp.success
 
 
+@pytest.mark.parametrize("solver", [cosamp, sp])
+def test_solve_with_tracker(solver):
+    sol = solver.operator_solve_jit(Phi, y, K, max_iters=20,
+        tracker=crs.noop_tracker)
+    rp = RecoveryPerformance(Phi, y, x, sol=sol)
+    assert rp.success
+
+
 def test_iht():
     sol = iht_solve_jit(Phi, y, K)
     rp = RecoveryPerformance(Phi, y, x, sol=sol)
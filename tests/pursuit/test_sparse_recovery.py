@@ -4,18 +4,22 @@ from functools import partial
 import jax
 from jax import random
 import jax.numpy as jnp
+import numpy as np
 
 import cr.sparse as crs
 from cr.sparse import pursuit
 import cr.sparse.data as crdata
 import cr.sparse.dict as crdict
 from cr.sparse.ef import RecoveryPerformance
+from cr.sparse.pursuit import RecoverySolution
 
 from cr.sparse.pursuit import omp
 from cr.sparse.pursuit import cosamp
 from cr.sparse.pursuit import sp
 from cr.sparse.pursuit import iht
 from cr.sparse.pursuit import htp
+from cr.sparse._src.pursuit.util import (_largest_indices_excluding,
+    _np_largest_indices_excluding)
 
 # Iterative Hard Thresholding
 iht_solve = partial(iht.matrix_solve, normalized=False)
@@ -43,6 +47,32 @@ x = jnp.squeeze(x)
 y = Phi @ x
 
 
+def test_largest_indices():
+    h = random.normal(key, (N,))
+    I = pursuit.largest_indices(h, K)
+    expected = jnp.argsort(jnp.abs(h))[:-K-1:-1]
+    assert jnp.array_equal(I, expected)
+
+
+@pytest.mark.parametrize("largest", [_largest_indices_excluding,
+    _np_largest_indices_excluding])
+def test_largest_indices_excluding(largest):
+    # only one entry outside I is nonzero, the rest tie at zero
+    h = np.zeros(N, dtype=np.float32)
+    h[2*K] = 1.
+    I = np.arange(2*K)
+    I_new = np.asarray(largest(h, I, 2*K))
+    assert I_new[0] == 2*K
+    assert not np.isin(I_new, I).any()
+
+
+def test_solve_normal_eqs():
+    Phi_I = Phi[:, :3*K]
+    expected, _, _, _ = jnp.linalg.lstsq(Phi_I, y)
+    x_I = pursuit.solve_normal_eqs(Phi_I, y)
+    assert jnp.allclose(x_I, expected, atol=1e-4)
+
+
 def test_omp():
     sol = omp.matrix_solve_jit(Phi, y, K)
     rp = RecoveryPerformance(Phi, y, x, sol=sol)
@@ -60,6 +90,80 @@ def test_sp():
     assert rp.success
 
 
+@pytest.mark.parametrize("solve", [cosamp.matrix_solve_jit,
+    sp.matrix_solve_jit, nhtp_solve_jit])
+def test_small_max_iters(solve):
+    # a small static budget runs through the unrolled loop
+    sol = solve(Phi, y, K, max_iters=6)
+    assert sol.iterations <= 6
+    rp = RecoveryPerformance(Phi, y, x, sol=sol)
+    assert rp.success
+
+
+@pytest.mark.parametrize("solve", [cosamp.matrix_solve_multi,
+    sp.matrix_solve_multi, partial(htp.matrix_solve_multi, normalized=True)])
+def test_matrix_solve_multi(solve):
+    X, omega = crdata.sparse_normal_representations(subkey, N, K, 3)
+    Y = Phi @ X
+    sol = solve(Phi, Y, K)
+    assert sol.x_I.shape == (3, K)
+    for i in range(3):
+        single = RecoverySolution(x_I=sol.x_I[i], I=sol.I[i], r=sol.r[i],
+            r_norm_sqr=sol.r_norm_sqr[i], iterations=sol.iterations[i], length=N)
+        rp = RecoveryPerformance(Phi, Y[:, i], X[:, i], sol=single)
+        assert rp.success
+
+
+@pytest.mark.parametrize("D", [Phi, Phi[:, :M//2]])
+def test_precompute_frame_bound(D):
+    pre = pursuit.precompute(D)
+    assert jnp.allclose(pre.upper_frame_bound, crdict.upper_frame_bound(D), rtol=1e-4)
+
+
+@pytest.mark.parametrize("solver", [cosamp, sp, htp])
+def test_precomputed_solve(solver):
+    pre = pursuit.precompute(Phi)
+    sol = solver.precomputed_solve_jit(pre, y, K)
+    expected = solver.matrix_solve_jit(Phi, y, K)
+    assert jnp.array_equal(sol.I, expected.I)
+    assert jnp.allclose(sol.x_I, expected.x_I)
+
+
+@pytest.mark.parametrize("solver", [cosamp, sp, htp])
+@pytest.mark.parametrize("dtype", [jnp.float32, jnp.bfloat16])
+def test_matrix_solve_dtype(solver, dtype):
+    sol = solver.matrix_solve_jit(Phi, y, K, dtype=dtype)
+    assert sol.x_I.dtype == jnp.float32
+    expected = solver.matrix_solve_jit(Phi, y, K)
+    assert jnp.array_equal(jnp.sort(sol.I), jnp.sort(expected.I))
+
+
+@pytest.mark.parametrize("solve", [cosamp.matrix_solve, sp.matrix_solve, htp_solve, nhtp_solve])
+def test_matrix_solve_np(solve):
+    Phi_np = np.asarray(Phi)
+    sol = solve(Phi_np, np.asarray(y), K)
+    assert isinstance(sol.x_I, np.ndarray)
+    expected = solve(Phi, y, K)
+    assert np.array_equal(np.sort(sol.I), np.sort(expected.I))
+    assert np.allclose(sol.x, expected.x, atol=1e-4)
+
+
+@pytest.mark.parametrize("solve", [cosamp.matrix_solve_jit, sp.matrix_solve_jit,
+    lambda Phi, y, K: cosamp.precomputed_solve_jit(pursuit.precompute(Phi), y, K),
+    lambda Phi, y, K: sp.precomputed_solve_jit(pursuit.precompute(Phi), y, K),
+    cosamp.matrix_solve, sp.matrix_solve])
+def test_merged_support_distinct(solve):
+    # the residual vanishes on all but one atom outside the support,
+    # so the new candidates must not tie-break back into the support
+    Phi = np.eye(20, dtype=np.float32)
+    y = np.zeros(20, dtype=np.float32)
+    y[:3] = [3., 2., 1.]
+    sol = solve(Phi, y, 2)
+    I, x_I = np.asarray(sol.I), np.asarray(sol.x_I)
+    assert np.all(np.isfinite(x_I))
+    assert np.array_equal(np.sort(I), [0, 1])
+    assert np.allclose(x_I[np.argsort(I)], [3., 2.])
+
 def test_iht():
     sol = iht_solve_jit(Phi, y, K)
     rp = RecoveryPerformance(Phi, y, x, sol=sol)